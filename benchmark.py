@@ -0,0 +1,454 @@
+"""
+Benchmarks for the interesting words pipeline.
+python benchmark.py generate --size 2G --output /tmp/corpus
+python benchmark.py pipeline --corpus /tmp/corpus --output results.json
+python benchmark.py compare baseline.json results.json
+python benchmark.py filters --tokens 10000000
+python benchmark.py startup --corpus documents
+python benchmark.py contexts --sentences 1000000 --words 50
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from string import punctuation
+
+from nltk import FreqDist, TweetTokenizer
+from nltk.corpus import stopwords
+
+from interesting_words import (
+    ContextExporter, ContextMatcher, DocumentAnalysis, DocumentScanner, DocumentTextExtractor, TokenFilter, WordCounter,
+    WordNormalizer, sent_tokenize
+)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import interesting_words
+timings = {'import': time.perf_counter() - start}
+if sys.argv[2] == 'preloaded':
+    start = time.perf_counter()
+    interesting_words.preload_nltk_resources()
+    timings['preload'] = time.perf_counter() - start
+for run in ('first result', 'second result'):
+    start = time.perf_counter()
+    interesting_words.DocumentTextExtractor(sys.argv[1], 4, 10).get_interesting_words(number_following=4)
+    timings[run] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def synthetic_tokens(number_of_tokens, vocabulary_size=50000, seed=0):
+    """
+    :param number_of_tokens: Int - number of tokens generated.
+    :param vocabulary_size: Int - number of distinct generated words, stopwords and punctuation are added to these.
+    :param seed: Int - random seed, so runs are comparable.
+    :return: List of lower case String tokens where roughly half are stopwords or punctuation.
+    """
+    rng = random.Random(seed)
+    words = [f'word{i}' for i in range(vocabulary_size)]
+    removed = stopwords.words('english') + list(punctuation)
+    return [
+        rng.choice(removed) if rng.random() < 0.5 else words[int(rng.paretovariate(1.2)) % vocabulary_size]
+        for _ in range(number_of_tokens)
+    ]
+
+
+def generate_corpus(output_directory, size, source_directory='documents', document_size=100000, seed=0):
+    """
+    Writes a synthetic corpus of paragraphs sampled from the documents of source_directory.
+    :param output_directory: String - directory the documents are written to, created if missing.
+    :param size: Int - total size of the corpus in bytes.
+    :param source_directory: String - directory of the documents paragraphs are sampled from.
+    :param document_size: Int - size of each generated document in bytes.
+    :param seed: Int - random seed, so the same corpus is generated for every commit.
+    :return: Int - number of documents written.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    for file_name in sorted(os.listdir(source_directory)):
+        with open(os.path.join(source_directory, file_name), encoding='utf-8') as file:
+            paragraphs += [line.strip().encode() + b'\n' for line in file if line.strip()]
+    os.makedirs(output_directory, exist_ok=True)
+    written = number_of_documents = 0
+    while written < size:
+        document_bytes = min(document_size, size - written)
+        with open(os.path.join(output_directory, f'doc_{number_of_documents:06d}.txt'), 'wb') as file:
+            document_written = 0
+            while document_written < document_bytes:
+                document_written += file.write(rng.choice(paragraphs))
+        written += document_written
+        number_of_documents += 1
+    return number_of_documents
+
+
+class StageRecorder:
+
+    def __init__(self, trace_allocations=False):
+        """
+        Accumulates time and allocations of named stages over repeated runs.
+        Allocations are counted as the net change in allocated memory blocks, sys.getallocatedblocks.
+        :param trace_allocations: Bool - whether the peak of traced memory of each stage is recorded with tracemalloc.
+        """
+        self.trace_allocations = trace_allocations
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager recording the stage run in its body.
+        :param name: String - name of the stage.
+        """
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'net_allocated_blocks': 0, 'peak_traced_bytes': 0})
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        yield
+        stage['seconds'] += time.perf_counter() - start
+        stage['net_allocated_blocks'] += sys.getallocatedblocks() - blocks
+        if self.trace_allocations:
+            stage['peak_traced_bytes'] = max(stage['peak_traced_bytes'], tracemalloc.get_traced_memory()[1])
+
+
+def peak_rss_bytes():
+    """
+    :return: Int - peak resident set size of this process in bytes, None where the resource module is missing.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def benchmark_pipeline(corpus_directory, number_following=4, most_common_number=10, trace_allocations=False):
+    """
+    Runs each stage of the pipeline separately over every document of the corpus.
+    Documents are memory-mapped as in the pipeline, so reading them is part of splitting them into sentences.
+    :param corpus_directory: String - directory of the documents.
+    :param number_following: Int - minimum number of following word types of interesting words.
+    :param most_common_number: Int - number of interesting words contexts are found for.
+    :param trace_allocations: Bool - whether the peak of traced memory of each stage is recorded.
+    :return: dict of the corpus, stages and peak RSS, see results_json.
+    """
+    recorder = StageRecorder(trace_allocations)
+    if trace_allocations:
+        tracemalloc.start()
+    tokenizer = TweetTokenizer()
+    analysis = DocumentAnalysis()
+    corpus = {'documents': 0, 'bytes': 0, 'sentences': 0, 'tokens': 0}
+    for document in DocumentScanner().scan(corpus_directory):
+        with recorder.stage('read and sentence split'):
+            spans = next(DocumentTextExtractor._iter_sentence_spans(document.path, None), [])
+        with recorder.stage('tokenize'):
+            sentences = [sentence for offset, end, sentence in spans]
+            byte_spans = [(offset, end - offset) for offset, end, sentence in spans]
+            tokenized_sentences = DocumentTextExtractor._tokenize_sentences(
+                document.name, sentences, tokenizer, byte_spans=byte_spans
+            )
+            word_tokens = [word for sentence in tokenized_sentences for word in sentence.words]
+        with recorder.stage('normalize_words'):
+            tagged_words = WordNormalizer().tag_words(word_tokens)
+        with recorder.stage('follower build'):
+            analysis.count_tokens(word_tokens)
+            analysis.add_tagged_words(tagged_words)
+        with recorder.stage('index'):
+            analysis.sentence_index.add_document(document.name, document.path)
+            for sentence in tokenized_sentences:
+                analysis.sentence_index.add(sentence)
+        corpus['documents'] += 1
+        corpus['bytes'] += document.size
+        corpus['sentences'] += len(sentences)
+        corpus['tokens'] += len(word_tokens)
+
+    with recorder.stage('most_common_words'):
+        interesting_ids = DocumentTextExtractor._find_number_follow_type_ids(analysis.follower_masks, number_following)
+        interesting_words = TokenFilter.stopword_filter().remove(analysis.vocabulary.decode(interesting_ids), True)
+        most_common_ids = WordCounter.most_common_word_ids(
+            analysis.counts, analysis.vocabulary.lookup(interesting_words), most_common_number
+        )
+        most_common_words = sorted(analysis.vocabulary.decode(most_common_ids))
+    with recorder.stage('get_word_contexts'):
+        contexts = analysis.sentence_index.get_word_contexts(most_common_words)
+    with tempfile.TemporaryDirectory() as directory, _working_directory(directory), recorder.stage('csv export'):
+        ContextExporter('interesting_words.csv').export(contexts)
+    if trace_allocations:
+        tracemalloc.stop()
+
+    for stage in recorder.stages.values():
+        stage['tokens_per_second'] = corpus['tokens'] / stage['seconds'] if stage['seconds'] else None
+    return {'corpus': corpus, 'stages': recorder.stages, 'peak_rss_bytes': peak_rss_bytes()}
+
+
+def benchmark_startup(corpus_directory, repeats=5):
+    """
+    Measures the latency of a short-lived process: importing interesting_words, then finding the interesting
+    words of the corpus twice, once with the NLTK data loaded on first use and once preloaded.
+    Each run is a new Python process so nothing is already imported or loaded.
+    :param corpus_directory: String - directory of the documents, best kept small.
+    :param repeats: Int - number of processes run for each mode, the median of each timing is reported.
+    :return: dict of form {mode: {timing: seconds}} for the modes 'lazy' and 'preloaded'.
+    """
+    results = {}
+    for mode in ('lazy', 'preloaded'):
+        runs = [
+            json.loads(subprocess.run(
+                [sys.executable, '-c', _STARTUP_SCRIPT, os.path.abspath(corpus_directory), mode],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout)
+            for _ in range(repeats)
+        ]
+        results[mode] = {timing: statistics.median(run[timing] for run in runs) for timing in runs[0]}
+    return results
+
+
+def results_json(results):
+    """
+    :param results: dict returned by a benchmark.
+    :return: dict of the results with the commit and environment they were measured on.
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        **results
+    }
+
+
+def compare_results(baseline, results, threshold=0.1):
+    """
+    :param baseline: dict of pipeline results to compare against.
+    :param results: dict of pipeline results.
+    :param threshold: Float - relative slowdown of a stage reported as a regression.
+    :return: List of tuples of form (stage, baseline seconds, seconds, ratio, regression - Bool).
+    """
+    comparison = []
+    for stage, timings in results['stages'].items():
+        if stage not in baseline['stages']:
+            continue
+        baseline_seconds = baseline['stages'][stage]['seconds']
+        ratio = timings['seconds'] / baseline_seconds if baseline_seconds else float('inf')
+        comparison.append((stage, baseline_seconds, timings['seconds'], ratio, ratio > 1 + threshold))
+    return comparison
+
+
+@contextmanager
+def _working_directory(directory):
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _time(function, *args):
+    """
+    :return: tuple of form (seconds, result) of a single call of function.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def _list_remove_from_tokens(tokens, remove_list):
+    """
+    List membership filter WordNormalizer.remove_from_tokens used before TokenFilter.
+    """
+    return [token for token in tokens if token.lower() not in remove_list]
+
+
+def _list_most_common_words(all_tokens, interesting_words, number):
+    """
+    List membership count WordCounter.most_common_words used before frozenset.
+    """
+    freq_dist = FreqDist([t for t in all_tokens if t in interesting_words]).most_common(number)
+    return sorted(w for (w, freq) in freq_dist)
+
+
+def benchmark_filters(number_of_tokens, number_interesting=200):
+    """
+    Compares list membership with the precompiled TokenFilter and frozenset lookups.
+    :param number_of_tokens: Int - size of the synthetic token stream.
+    :param number_interesting: Int - number of interesting words counted.
+    :return: List of tuples of form (stage, list seconds, set seconds).
+    """
+    tokens = synthetic_tokens(number_of_tokens)
+    remove_list = stopwords.words('english') + list(punctuation)
+    interesting_words = [f'word{i}' for i in range(number_interesting)]
+    results = []
+
+    list_seconds, list_result = _time(_list_remove_from_tokens, tokens, remove_list)
+    remove_filter = TokenFilter(remove_list)
+    set_seconds, set_result = _time(remove_filter.remove, tokens, True)
+    assert list_result == set_result
+    results.append(('remove stopwords and punctuation', list_seconds, set_seconds))
+
+    list_seconds, list_result = _time(_list_most_common_words, tokens, interesting_words, 10)
+    set_seconds, set_result = _time(WordCounter.most_common_words, tokens, interesting_words, 10)
+    assert list_result == set_result
+    results.append(('count interesting words', list_seconds, set_seconds))
+    return results
+
+
+def _tokenized_word_contexts(sentences, words):
+    """
+    Tokenizes every sentence as WordContextFinder.get_word_contexts did before ContextMatcher.
+    """
+    tokenizer = TweetTokenizer()
+    lower_case_words = {w.lower() for w in words}
+    context_dict = defaultdict(list)
+    for document, sentence in sentences:
+        for word in lower_case_words.intersection([w.lower() for w in tokenizer.tokenize(sentence)]):
+            context_dict[word].append(f'{document}: {sentence}')
+    return context_dict
+
+
+def benchmark_contexts(number_of_sentences, number_of_words=50, workers=1, source_directory='documents', seed=0):
+    """
+    Compares tokenizing every sentence with ContextMatcher for an ad-hoc list of words.
+    :param number_of_sentences: Int - number of sentences sampled from the documents of source_directory.
+    :param number_of_words: Int - number of words sampled from the tokens of the sentences, as the interesting
+        words are neither stopwords nor punctuation.
+    :param workers: Int - number of threads ContextMatcher matches in.
+    :param seed: Int - random seed, so runs are comparable.
+    :return: tuple of form (tokenize seconds, matcher seconds, number of contexts).
+    """
+    rng = random.Random(seed)
+    source_sentences = []
+    for file_name in sorted(os.listdir(source_directory)):
+        with open(os.path.join(source_directory, file_name)) as file:
+            source_sentences.extend((file_name, sentence) for sentence in sent_tokenize(file.read()))
+    sentences = [rng.choice(source_sentences) for _ in range(number_of_sentences)]
+    tokenizer = TweetTokenizer()
+    removed = set(stopwords.words('english') + list(punctuation))
+    vocabulary = sorted(
+        {w.lower() for _, sentence in source_sentences for w in tokenizer.tokenize(sentence)} - removed
+    )
+    words = rng.sample(vocabulary, min(number_of_words, len(vocabulary)))
+
+    tokenize_seconds, tokenize_result = _time(_tokenized_word_contexts, sentences, words)
+    matcher_seconds, matcher_result = _time(ContextMatcher(words, tokenizer).word_contexts, sentences, 100000, workers)
+    assert tokenize_result == matcher_result
+    return tokenize_seconds, matcher_seconds, sum(map(len, matcher_result.values()))
+
+
+def _parse_size(size):
+    """
+    :param size: String - number of bytes with an optional K, M or G suffix, e.g. 500M.
+    :return: Int - number of bytes.
+    """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='write a synthetic corpus from the bundled documents')
+    generate_parser.add_argument('--size', type=_parse_size, required=True, help='corpus size, e.g. 500M or 2G')
+    generate_parser.add_argument('--output', required=True)
+    generate_parser.add_argument('--source', default='documents')
+    generate_parser.add_argument('--document-size', type=_parse_size, default=100000)
+    generate_parser.add_argument('--seed', type=int, default=0)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help='time each stage of the pipeline over a corpus')
+    pipeline_parser.add_argument('--corpus', default='documents')
+    pipeline_parser.add_argument('--number-following', type=int, default=4)
+    pipeline_parser.add_argument('--most-common', type=int, default=10)
+    pipeline_parser.add_argument('--trace-allocations', action='store_true', help='record peak memory with tracemalloc')
+    pipeline_parser.add_argument('--output', help='JSON file the results are written to')
+
+    compare_parser = subparsers.add_parser('compare', help='compare pipeline results of two commits')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+
+    filters_parser = subparsers.add_parser('filters', help='list membership against TokenFilter and frozenset')
+    filters_parser.add_argument('--tokens', type=int, default=10000000)
+    filters_parser.add_argument('--interesting', type=int, default=200)
+
+    startup_parser = subparsers.add_parser('startup', help='import and first result latency of a new process')
+    startup_parser.add_argument('--corpus', default='documents')
+    startup_parser.add_argument('--repeats', type=int, default=5)
+    startup_parser.add_argument('--output', help='JSON file the results are written to')
+
+    contexts_parser = subparsers.add_parser('contexts', help='tokenizing every sentence against ContextMatcher')
+    contexts_parser.add_argument('--sentences', type=int, default=1000000)
+    contexts_parser.add_argument('--words', type=int, default=50)
+    contexts_parser.add_argument('--workers', type=int, default=1)
+    contexts_parser.add_argument('--source', default='documents')
+    args = parser.parse_args()
+
+    if args.benchmark == 'generate':
+        number_of_documents = generate_corpus(args.output, args.size, args.source, args.document_size, args.seed)
+        print(f'wrote {number_of_documents} documents to {args.output}')
+    elif args.benchmark == 'pipeline':
+        results = results_json(
+            benchmark_pipeline(args.corpus, args.number_following, args.most_common, args.trace_allocations)
+        )
+        print(f'{"stage":<20}{"seconds":>10}{"tokens/s":>16}{"net blocks":>12}')
+        for stage, timings in results['stages'].items():
+            tokens_per_second, blocks = timings['tokens_per_second'] or 0, timings['net_allocated_blocks']
+            print(f'{stage:<20}{timings["seconds"]:>10.3f}{tokens_per_second:>16,.0f}{blocks:>12,}')
+        print(f'{results["corpus"]["tokens"]:,} tokens, peak RSS {results["peak_rss_bytes"] or 0:,} bytes')
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+    elif args.benchmark == 'compare':
+        with open(args.baseline) as baseline_file, open(args.results) as results_file:
+            comparison = compare_results(json.load(baseline_file), json.load(results_file), args.threshold)
+        print(f'{"stage":<20}{"baseline (s)":>14}{"results (s)":>14}{"ratio":>8}')
+        for stage, baseline_seconds, seconds, ratio, regression in comparison:
+            flag = '  REGRESSION' if regression else ''
+            print(f'{stage:<20}{baseline_seconds:>14.3f}{seconds:>14.3f}{ratio:>8.2f}{flag}')
+        sys.exit(1 if any(regression for *_, regression in comparison) else 0)
+    elif args.benchmark == 'filters':
+        print(f'{"stage":<36}{"list (s)":>12}{"set (s)":>12}{"speedup":>10}')
+        for stage, list_seconds, set_seconds in benchmark_filters(args.tokens, args.interesting):
+            print(f'{stage:<36}{list_seconds:>12.2f}{set_seconds:>12.2f}{list_seconds / set_seconds:>9.1f}x')
+    elif args.benchmark == 'startup':
+        results = results_json({'startup': benchmark_startup(args.corpus, args.repeats)})
+        for mode, timings in results['startup'].items():
+            print(f'{mode:<12}' + ''.join(f'{timing}: {seconds:.3f}s  ' for timing, seconds in timings.items()))
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+
+    elif args.benchmark == 'contexts':
+        tokenize_seconds, matcher_seconds, number_of_contexts = benchmark_contexts(
+            args.sentences, args.words, args.workers, args.source
+        )
+        print(f'{"tokenize (s)":>14}{"matcher (s)":>14}{"speedup":>10}{"contexts":>12}')
+        print(f'{tokenize_seconds:>14.2f}{matcher_seconds:>14.2f}{tokenize_seconds / matcher_seconds:>9.1f}x'
+              f'{number_of_contexts:>12,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,354 @@
+import codecs
+import cProfile
+import csv
+import fnmatch
+import hashlib
+import heapq
+import json
+import math
+import mmap
 import os
-from collections import defaultdict
-import ssl
+import pickle
+import re
+import sqlite3
+import time
+import tracemalloc
+from array import array
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import groupby, islice, repeat
+from operator import itemgetter
 from string import punctuation
 
-import pandas as pd
-from nltk import download, sent_tokenize, pos_tag, FreqDist, TweetTokenizer, bigrams
-from nltk.corpus import stopwords
+import numpy as np
 
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+    'universal_tagset': 'taggers/universal_tagset',
+    'averaged_perceptron_tagger': 'taggers/averaged_perceptron_tagger',
+}
 
-def download_nltk_data():
+
+def missing_nltk_resources():
+    """
+    Looks the NLTK data up in the local data directories only, without going to the network.
+    :return: List of Strings - names of the NLTK_RESOURCES packages that are not installed.
+    """
+    from nltk.data import find
+    missing = []
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            find(resource)
+        except LookupError:
+            missing.append(package)
+    return missing
+
+
+def download_nltk_data(allow_unverified_ssl=True):
+    """
+    Downloads the NLTK data that is not installed yet, does nothing when it all is.
+    :param allow_unverified_ssl: Bool - whether packages that fail to download are tried again without verifying
+        the server's certificate, for Python installs without root certificates. Verification is restored after.
+    :return: List of Strings - names of the packages that were missing.
+    """
+    missing = missing_nltk_resources()
+    if not missing:
+        return missing
+    import ssl
+    from nltk import download
+    failed = [package for package in missing if not download(package)]
+    if failed and allow_unverified_ssl:
+        create_default_https_context = ssl._create_default_https_context
+        ssl._create_default_https_context = ssl._create_unverified_context
+        try:
+            for package in failed:
+                download(package)
+        finally:
+            ssl._create_default_https_context = create_default_https_context
+    return missing
+
+
+@lru_cache(maxsize=None)
+def _sentence_tokenizer(language='english'):
+    from nltk.data import load
+    return load(f'tokenizers/punkt/{language}.pickle')
+
+
+@lru_cache(maxsize=None)
+def _word_tokenizer():
+    from nltk import TweetTokenizer
+    return TweetTokenizer()
+
+
+@lru_cache(maxsize=None)
+def _tagger():
+    from nltk.tag import PerceptronTagger
+    return PerceptronTagger()
+
+
+def sentence_spans(text, language='english'):
+    """
+    :param text: String - text to split into sentences.
+    :param language: String - the model name in the punkt corpus.
+    :return: List of tuples of form (start, end) - character offsets of the sentences sent_tokenize returns.
+    """
+    return list(_sentence_tokenizer(language).span_tokenize(text))
+
+
+def sent_tokenize(text, language='english'):
+    """
+    nltk.sent_tokenize with the punkt model loaded once per process.
+    :param text: String - text to split into sentences.
+    :param language: String - the model name in the punkt corpus.
+    :return: List of Strings - sentences of the text.
+    """
+    return _sentence_tokenizer(language).tokenize(text)
+
+
+def pos_tag(tokens, tagset=None):
+    """
+    nltk.pos_tag with the perceptron tagger loaded once per process, rather than on every call.
+    :param tokens: List of Strings - tokens to tag.
+    :param tagset: String - tagset the Penn Treebank tags are mapped to, such as 'universal'.
+    :return: List of tuples in form (word, word type).
+    """
+    if isinstance(tokens, str):
+        raise TypeError('tokens: expected a list of strings, got a string')
+    tagged_tokens = _tagger().tag(tokens)
+    if tagset:
+        from nltk.tag import map_tag
+        tagged_tokens = [(token, map_tag('en-ptb', tagset, tag)) for token, tag in tagged_tokens]
+    return tagged_tokens
+
+
+def pos_tag_sents(sentences, tagset=None):
+    """
+    :param sentences: List of Lists of Strings - tokens of each sentence.
+    :param tagset: String - tagset the Penn Treebank tags are mapped to, such as 'universal'.
+    :return: List of Lists of tuples in form (word, word type), one for each sentence.
+    """
+    return [pos_tag(tokens, tagset) for tokens in sentences]
+
+
+def preload_nltk_resources(language='english'):
+    """
+    Loads the sentence tokenizer, word tokenizer, tagger and stopwords, otherwise loaded on first use,
+    so every extraction in a long-lived process shares them and the first one is as fast as the rest.
+    Call it before analysing documents in workers so forked processes start with them loaded.
+    :param language: String - language of the punkt model and stopwords.
+    """
+    _sentence_tokenizer(language)
+    _word_tokenizer()
+    pos_tag(['preload'], tagset='universal')
+    TokenFilter.stopword_filter(language)
+
+
+TAGS = ('.', 'ADJ', 'ADP', 'ADV', 'CONJ', 'DET', 'NOUN', 'NUM', 'PRON', 'PRT', 'VERB', 'X')
+TAG_IDS = {tag: i for i, tag in enumerate(TAGS)}
+_MASK_BIT_COUNTS = np.array([bin(mask).count('1') for mask in range(1 << len(TAGS))], dtype=np.uint8)
+
+
+class TokenizedSentence(
+    namedtuple('TokenizedSentence', ['document', 'sentence_id', 'sentence', 'words', 'offset', 'length'],
+               defaults=(None, None))
+):
+    """
+    Sentence produced by the single tokenization pass over a document.
+    - document: String - name of the document the sentence was read from.
+    - sentence_id: Int - offset of the sentence within its document.
+    - sentence: String - the sentence as it appears in the document.
+    - words: List of Strings - word tokens of the sentence in lower case.
+    - offset: Int - byte offset of the sentence in the document file, None when not read from a file.
+    - length: Int - length of the sentence in bytes, None when not read from a file.
+    """
+    __slots__ = ()
+
+
+class ScannedDocument(namedtuple('ScannedDocument', ['path', 'name', 'size', 'mtime'])):
+    """
+    Document listed by DocumentScanner.
+    - path: String - path to the document.
+    - name: String - path of the document relative to the scanned directory, its sentences are recorded under.
+    - size: Int - size of the document in bytes.
+    - mtime: Int - modification time of the document in nanoseconds.
+    """
+    __slots__ = ()
+
+
+_WHITESPACE = re.compile(rb'\s')
+
+
+@contextmanager
+def _map_document(document_path):
+    """
+    Memory-maps a document read only.
+    :param document_path: String representing path to document.
+    :return: context manager of the mmap of the document, of empty bytes for an empty document.
+    """
+    with open(document_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+
+def _decode(buffer, start, end):
+    """
+    Decodes a slice of a memory-mapped document without copying it first, translating newlines like text mode.
+    :param buffer: mmap or bytes of the document.
+    :param start: Int - byte offset of the slice.
+    :param end: Int - byte offset of the end of the slice.
+    :return: String - the decoded slice.
+    """
+    with memoryview(buffer) as view:
+        return _translate_newlines(str(view[start:end], 'utf-8'))
+
+
+def _translate_newlines(text):
+    """
+    :param text: String - text decoded from a document opened in binary mode.
+    :return: String - the text with newlines translated as when the document is opened in text mode.
+    """
+    return text.replace('\r\n', '\n').replace('\r', '\n') if '\r' in text else text
+
+
+@contextmanager
+def _timed(stage_seconds, stage):
+    """
+    Adds the time spent in the body to stage_seconds[stage].
+    :param stage_seconds: dict of form {stage - String: seconds - Float}.
+    :param stage: String - name of the stage.
+    """
+    start = time.perf_counter()
     try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        pass
-    else:
-        ssl._create_default_https_context = _create_unverified_https_context
+        yield
+    finally:
+        stage_seconds[stage] += time.perf_counter() - start
+
+
+class DocumentScanner:
+
+    _BYTE_ORDER_MARKS = (
+        (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+        (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'),
+    )
+
+    def __init__(self, include=None, exclude=(), recursive=True, sample_size=8192):
+        """
+        Lists the documents of a directory and its subdirectories in directory listing order.
+        Names relative to the directory, such as 'notes/a.txt', are matched against glob patterns.
+        Documents are read as UTF-8, so the start of each document is checked and binary documents
+        or documents in other encodings are skipped. A document only found not to be UTF-8 past its start
+        is skipped by DocumentTextExtractor once it is read.
+        :param include: iterable of glob patterns, e.g. ['*.txt'] - only documents matching one are listed,
+            None lists every document.
+        :param exclude: iterable of glob patterns, e.g. ['drafts/*'] - documents and directories matching one
+            are not listed.
+        :param recursive: Bool - whether subdirectories are scanned.
+        :param sample_size: Int - number of bytes read from the start of each document to detect its encoding.
+        """
+        self._include = None if include is None else tuple(include)
+        self._exclude = tuple(exclude)
+        self._recursive = recursive
+        self._sample_size = sample_size
+        self.skipped = {}
+
+    @property
+    def settings(self):
+        """
+        :return: tuple of the settings the documents listed depend on, in the order of the constructor's arguments.
+        """
+        return self._include, self._exclude, self._recursive, self._sample_size
+
+    def scan(self, directory_name, unchanged=None):
+        """
+        :param directory_name: String - name of the directory scanned.
+        :param unchanged: function of form (path, size, mtime) -> Bool - documents it is True for, such as
+            documents with a valid cached result, are known to be UTF-8 and are not read again.
+        :return: List of ScannedDocument. The documents skipped are kept in skipped, a dict of form
+            {name: encoding detected}.
+        """
+        self.skipped = {}
+        documents = []
+        for entry, name in self._walk(directory_name, ''):
+            stat = entry.stat()
+            document = ScannedDocument(f'{directory_name}/{name}', name, stat.st_size, stat.st_mtime_ns)
+            if unchanged is not None and unchanged(document.path, document.size, document.mtime):
+                documents.append(document)
+                continue
+            encoding = self.detect_encoding(document.path)
+            if encoding == 'utf-8':
+                documents.append(document)
+            else:
+                self.skipped[name] = encoding
+        return documents
+
+    def detect_encoding(self, document_path):
+        """
+        :param document_path: String representing path to document.
+        :return: String - 'utf-16' or 'utf-32' when the document starts with their byte order mark,
+            'binary' when its start has a NUL byte, otherwise 'utf-8' when its start decodes as UTF-8 or 'unknown'.
+        """
+        with open(document_path, 'rb') as file:
+            sample = file.read(self._sample_size)
+        for byte_order_mark, encoding in self._BYTE_ORDER_MARKS:
+            if sample.startswith(byte_order_mark):
+                return encoding
+        if b'\x00' in sample:
+            return 'binary'
+        try:
+            # the sample may end inside a character unless it is the whole document
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=len(sample) < self._sample_size)
+        except UnicodeDecodeError:
+            return 'unknown'
+        return 'utf-8'
+
+    def _walk(self, directory_name, prefix):
+        """
+        :param directory_name: String - name of the directory scanned.
+        :param prefix: String - name of the subdirectory being scanned relative to directory_name, ending with '/'.
+        :return: generator of tuples of form (os.DirEntry, name) of the files listed, depth first.
+            Like os.walk, symbolic links to directories are not followed, so no directory is scanned twice
+            and a link to a directory above it does not loop. Symbolic links to files are listed.
+        """
+        with os.scandir(f'{directory_name}/{prefix}' if prefix else directory_name) as entries:
+            entries = list(entries)
+        for entry in entries:
+            name = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if self._recursive and not self._matches(f'{name}/', self._exclude):
+                    yield from self._walk(directory_name, f'{name}/')
+            elif entry.is_file() and not self._matches(name, self._exclude):
+                if self._include is None or self._matches(name, self._include):
+                    yield entry, name
 
-    download('punkt')
-    download('stopwords')
-    download('universal_tagset')
-    download('averaged_perceptron_tagger')
+    @staticmethod
+    def _matches(name, patterns):
+        """
+        :param name: String - name relative to the scanned directory, directories ending with '/'.
+        :param patterns: tuple of glob patterns.
+        :return: Bool - whether name, or a directory name without its final '/', matches any of patterns.
+        """
+        return any(
+            fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(name.rstrip('/'), pattern) for pattern in patterns
+        )
 
 
 class DocumentTextExtractor:
 
-    def __init__(self, directory_name, number_following, most_common_number):
+    PARTIAL_VERSION = 8
+    MAX_SENTENCE_SIZE = 1 << 16
+
+    def __init__(
+        self, directory_name, number_following, most_common_number, workers=1, chunk_size=None, cache_path=None,
+        tagging_backend=None, metrics=None, shard=None, tag_window=0, scanner=None, deduplicator=None
+    ):
         """
-        - Reads all documents in specified directory.
+        - Reads all documents in specified directory and its subdirectories.
         - Find all types (nouns, verbs etc.) of words that follow each word.
         - Finds words with at least number_following number of different following types
         - returns most_common_number of most the above words
@@ -34,20 +356,176 @@ class DocumentTextExtractor:
         :param directory_name: String - name of directory where files to be read are.
         :param number_following: Int - minimum number required of following word kinds (Nouns, verbs etc.).
         :param most_common_number: Int - number of results returned.
+        :param workers: Int - number of processes documents are analysed in, 1 analyses them in this process,
+            None uses one process per CPU.
+        :param chunk_size: Int - when given documents are streamed in chunks of about chunk_size bytes
+            and sentences are not kept in memory, contexts are then found by reading the documents again.
+        :param cache_path: String - path of a file where per-document results are kept between runs,
+            so only new or changed documents are analysed again.
+        :param tagging_backend: tagging backend, such as CachedTaggingBackend, each sentence is tagged with.
+            None tags each document's words in a single pos_tag call.
+        :param metrics: PipelineMetrics the stages of the run are timed and counted in,
+            its sinks are sent a report once the csv is exported.
+        :param shard: tuple of form (shard index, number of shards) - only the documents whose file name hashes
+            to the shard are read, see shard_index. Partial results of the shards are saved with save_partial
+            and combined with from_partials.
+        :param tag_window: Int - when given the types up to tag_window words before and after each word within
+            its sentence are counted too, for analysis.most_ambiguous_words.
+        :param scanner: DocumentScanner the documents are listed with, by default every UTF-8 document
+            of the directory and its subdirectories.
+        :param deduplicator: SentenceDeduplicator - when given each context of a repeated sentence lists all
+            the documents it appears in. Words are still counted in every copy. A given tagging_backend is wrapped
+            in a CachedTaggingBackend so repeated sentences are tagged once, within each document when workers
+            is not 1 unless it has a store_path. Without a tagging_backend each document is still tagged in
+            a single pos_tag call, so the interesting words are the same as without a deduplicator.
         """
         self._directory_name = directory_name
         self._number_following = number_following
         self._most_common_number = most_common_number
-        self._word_tokens = []
-        self._sentence_tokens = []
-        self.tokenizer = TweetTokenizer
+        self._workers = workers
+        self._chunk_size = chunk_size
+        self._cache_path = cache_path
+        if deduplicator is not None and tagging_backend is not None:
+            if not isinstance(tagging_backend, CachedTaggingBackend):
+                tagging_backend = CachedTaggingBackend(tagging_backend, deduplicator.max_sentences)
+        self._tagging_backend = tagging_backend
+        self._deduplicator = deduplicator
+        self._shard = shard
+        self._tag_window = tag_window
+        self._scanner = DocumentScanner() if scanner is None else scanner
+        self.metrics = PipelineMetrics() if metrics is None else metrics
+        self._analysis = DocumentAnalysis(tag_window)
+        self._corpus_analysis = None
+        self._undecodable = set()
+
+    @classmethod
+    def from_partials(cls, partial_paths, number_following, most_common_number, metrics=None):
+        """
+        Combines the partial results of shards saved by save_partial, in shard order, into an extractor
+        that exports the interesting words of all of them without reading the documents again.
+        The partials' sentences are read from the document paths they were analysed with, and streamed partials
+        read the contexts again from the documents their scanner listed, with their deduplicator.
+        :param partial_paths: iterable of Strings - paths of partial result files, each shard at most once.
+        :param number_following: Int - minimum number required of following word kinds (Nouns, verbs etc.).
+        :param most_common_number: Int - number of results returned.
+        :param metrics: PipelineMetrics the merge and export are timed in.
+        :return: DocumentTextExtractor.
+        """
+        partials = sorted((cls._load_partial(partial_path) for partial_path in partial_paths), key=itemgetter('shard'))
+        if not partials:
+            raise ValueError('partial_paths: expected at least one partial result')
+        settings = {
+            (
+                partial['directory'], partial['chunk_size'], partial['tag_window'], partial['scanner'],
+                partial['deduplicator']
+            )
+            for partial in partials
+        }
+        if len(settings) > 1:
+            raise ValueError(
+                'partial_paths: partials of different directories, chunk sizes, tag windows, scanners or deduplicators'
+            )
+        shards = [partial['shard'] for partial in partials]
+        if len(set(shards)) < len(shards) or len({number_of_shards for index, number_of_shards in shards}) > 1:
+            raise ValueError(f'partial_paths: shards {shards} are repeated or of different numbers of shards')
+        deduplicator = partials[0]['deduplicator']
+        extractor = cls(
+            partials[0]['directory'], number_following, most_common_number, chunk_size=partials[0]['chunk_size'],
+            metrics=metrics, tag_window=partials[0]['tag_window'], scanner=DocumentScanner(*partials[0]['scanner']),
+            deduplicator=None if deduplicator is None else SentenceDeduplicator(*deduplicator)
+        )
+        with extractor.metrics.stage('merge'):
+            for partial in partials:
+                extractor._analysis.merge(partial['analysis'])
+        with extractor.metrics.stage('freeze analysis'):
+            extractor._corpus_analysis = CorpusAnalysis(extractor._analysis)
+        return extractor
+
+    def save_partial(self, partial_path):
+        """
+        Analyses the documents of the shard and writes the partial result - counts, following types and
+        sentence postings - replacing partial_path only once it is complete.
+        :param partial_path: String - path of the partial result file.
+        """
+        if self._corpus_analysis is None:
+            self._extract_sentence_and_work_tokens(self._directory_name)
+        partial = {
+            'version': self.PARTIAL_VERSION,
+            'directory': self._directory_name,
+            'chunk_size': self._chunk_size,
+            'tag_window': self._tag_window,
+            'scanner': self._scanner.settings,
+            'deduplicator': None if self._deduplicator is None else self._deduplicator.settings,
+            'shard': self._shard or (0, 1),
+            'analysis': self._analysis,
+        }
+        temporary_path = f'{partial_path}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(partial, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, partial_path)
+
+    @staticmethod
+    def shard_index(file_name, number_of_shards):
+        """
+        :param file_name: String - name of a document relative to the directory.
+        :param number_of_shards: Int - number of shards the directory is split into.
+        :return: Int - shard of the document, the same in every process and on every machine.
+        """
+        digest = hashlib.blake2b(file_name.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % number_of_shards
+
+    @property
+    def analysis(self):
+        """
+        :return: CorpusAnalysis of the directory, built the first time it is used and then reused by every query.
+        """
+        if self._corpus_analysis is None:
+            self._extract_sentence_and_work_tokens(self._directory_name)
+            with self.metrics.stage('freeze analysis'):
+                self._corpus_analysis = CorpusAnalysis(self._analysis)
+        return self._corpus_analysis
+
+    @property
+    def _word_tokens(self):
+        """
+        :return: List of Strings representing all words of the read documents in lower case.
+        """
+        return self._analysis.vocabulary.decode(self._analysis.token_ids)
+
+    @property
+    def _sentence_tokens(self):
+        """
+        :return: List of tuples of form (document_name, sentence).
+        """
+        return list(self._analysis.sentence_index.sentences())
+
+    def export_interesting_words_as_csv(self, output='interesting_words.csv', max_contexts=None):
+        """
+        :param output: String path or text file object the csv is written to.
+        :param max_contexts: Int - maximum number of sentence contexts written for each word, None writes all.
+        :return: Int - number of context rows written.
+        """
+        return self.export_interesting_words(output, 'csv', max_contexts)
 
-    def export_interesting_words_as_csv(self):
-        interesting_words = self.get_interesting_words(number_following=self._number_following)
-        most_common_10 = WordCounter.most_common_words(self._word_tokens, interesting_words, self._most_common_number)
-        contexts = WordContextFinder.get_word_contexts(self._sentence_tokens, most_common_10, self.tokenizer)
-        data_tabulate = self._convert_to_csv_form(contexts)
-        self._export_csv(data_tabulate)
+    def export_interesting_words(self, output, output_format=None, max_contexts=None):
+        """
+        Streams the sentence contexts of the most common interesting words to output, a few rows at a time,
+        sentences being read from their documents only as they are written.
+        :param output: String path or file object the contexts are written to.
+        :param output_format: String - 'csv', 'jsonl' or 'parquet', by default taken from the extension of output.
+        :param max_contexts: Int - maximum number of sentence contexts written for each word, None writes all.
+        :return: Int - number of context rows written.
+        """
+        most_common_10 = self.most_common_words()
+        if self._chunk_size is None:
+            contexts = self.analysis.word_contexts(most_common_10, max_contexts)
+        else:
+            contexts = self.get_word_contexts(most_common_10)
+        with self.metrics.stage('export'):
+            rows = ContextExporter(output, output_format, max_contexts).export(contexts)
+        self.metrics.counters['exported_rows'] = rows
+        self.metrics.emit()
+        return rows
 
     def get_interesting_words(self, number_following=4):
         """
@@ -55,16 +533,43 @@ class DocumentTextExtractor:
         :param number_following: Int - minimum number required of following word kinds.
         :return: List of Strings representing interesting words.
         """
-        self._extract_sentence_and_work_tokens(self._directory_name)
-        tagged_normalized_words = WordNormalizer().normalize_words(self._word_tokens)
-        following_dict = self._create_word_type_following_dict(tagged_normalized_words)
-        interesting_words = self._find_number_follow_types(following_dict, number_following)
-        return WordNormalizer.remove_from_tokens(interesting_words, stopwords.words('english'))
+        analysis = self.analysis
+        with self.metrics.stage('interesting words'):
+            return analysis.interesting_words(number_following)
+
+    def most_common_words(self, number_following=None, most_common_number=None):
+        """
+        :param number_following: Int - minimum number required of following word kinds, the extractor's by default.
+        :param most_common_number: Int - number of results returned, the extractor's by default.
+        :return: List of Strings - the most common interesting words ordered alphabetically.
+        """
+        analysis = self.analysis
+        with self.metrics.stage('most common words'):
+            return analysis.most_common_words(
+                self._number_following if number_following is None else number_following,
+                self._most_common_number if most_common_number is None else most_common_number,
+            )
+
+    def get_word_contexts(self, words):
+        """
+        Looks up the sentence contexts of any words in the index built while reading the documents.
+        When streaming the documents are read again instead, one chunk at a time.
+        :param words: list of Strings corresponding to words tokens.
+        :return: dict of form {word - String: ['sentence contexts']}.
+        """
+        if self._chunk_size is None:
+            analysis = self.analysis
+            with self.metrics.stage('word contexts'):
+                return analysis.sentence_index.get_word_contexts(words)
+        with self.metrics.stage('word contexts'):
+            return WordContextFinder.get_tokenized_word_contexts(
+                self._iter_sentences(self._directory_name), words, self._deduplicator
+            )
 
     @staticmethod
     def _get_string_from_document(document_path):
         """
-        Gets document as String.
+        Gets document as String. Only used by tests, the pipeline memory-maps documents, see _iter_sentence_spans.
         :param document_path: String representing path to document.
         :return: String - representing file content.
         """
@@ -73,14 +578,247 @@ class DocumentTextExtractor:
 
     def _extract_sentence_and_work_tokens(self, directory_name):
         """
-        Sets _word_tokens variable as list of Strings representing words in lower case.
-        Sets _sentence_tokens variable as list of Strings representing sentences.
+        Analyses every document in the directory, in a pool of _workers processes unless _workers is 1,
+        and merges the per-document partial results into a new _analysis in directory listing order.
+        With a cache only documents without a valid cached result are analysed, and unchanged documents
+        are not read by the scanner.
         :param directory_name: String representing directory name.
         """
-        for file_name in os.listdir(directory_name):
-            document_string = self._get_string_from_document(f'{directory_name}/{file_name}')
-            self._word_tokens += [w.lower() for w in self.tokenizer().tokenize(document_string)]
-            self._sentence_tokens += [(file_name, sent) for sent in sent_tokenize(document_string)]
+        self._analysis = DocumentAnalysis(self._tag_window)
+        self._undecodable = set()
+        if self._cache_path is not None:
+            with self.metrics.stage('cache'):
+                cache = AnalysisCache(self._cache_path)
+        unchanged = None if self._cache_path is None else cache.unchanged
+        with self.metrics.stage('list documents'):
+            documents = self._list_shard_documents(directory_name, unchanged)
+        if self._cache_path is None:
+            partials = self._analyse_documents(documents)
+            missing = range(len(documents))
+        else:
+            settings = self._tag_window, self._deduplicator, self._tagging_backend
+            with self.metrics.stage('cache'):
+                partials = [cache.get(document.path, self._chunk_size, *settings) for document in documents]
+            missing = [i for i, partial in enumerate(partials) if partial is None]
+            analysed = self._analyse_documents([documents[i] for i in missing])
+            for i, partial in zip(missing, analysed):
+                if partial is not None:
+                    with self.metrics.stage('cache'):
+                        cache.put(documents[i].path, self._chunk_size, partial, *settings)
+                partials[i] = partial
+            with self.metrics.stage('cache'):
+                cache.evict_deleted()
+                cache.save()
+        for partial in partials:
+            if partial is not None:
+                with self.metrics.stage('merge'):
+                    self._analysis.merge(partial)
+        self.metrics.counters.update(
+            documents=len(documents) - len(self._undecodable),
+            documents_analysed=len(missing) - len(self._undecodable),
+            documents_skipped=len(self._scanner.skipped) + len(self._undecodable),
+            bytes=sum(document.size for document in documents if document.name not in self._undecodable),
+            sentences=self._analysis.number_of_sentences,
+            duplicate_sentences=self._analysis.sentence_index.number_of_duplicates,
+            tokens=int(self._analysis.counts.sum()),
+            unique_words=len(self._analysis.vocabulary),
+        )
+
+    def _analyse_documents(self, documents):
+        """
+        In a pool the largest documents are analysed first, so a large document listed last does not
+        leave the other workers idle while it is analysed on its own.
+        A document that is not UTF-8 past the start the scanner checked is skipped and added to _undecodable.
+        :param documents: List of ScannedDocument.
+        :return: generator of DocumentAnalysis, one for each document in the order given, None for a skipped
+            document. The time spent in each stage of analysing the documents is added to the metrics.
+        """
+        arguments = (self._chunk_size, self._tagging_backend, self._tag_window, self._deduplicator)
+        if not documents:
+            return
+        if self._workers == 1:
+            executor = None
+            results = [
+                lambda document=document: analyse_document(document.path, document.name, *arguments)
+                for document in documents
+            ]
+        else:
+            executor = ProcessPoolExecutor(max_workers=self._workers)
+            futures = [None] * len(documents)
+            for i in sorted(range(len(documents)), key=lambda i: documents[i].size, reverse=True):
+                futures[i] = executor.submit(analyse_document, documents[i].path, documents[i].name, *arguments)
+            results = [future.result for future in futures]
+        try:
+            for document, result in zip(documents, results):
+                with self.metrics.stage('analyse documents'):
+                    try:
+                        partial = result()
+                    except UnicodeDecodeError:
+                        self._undecodable.add(document.name)
+                        partial = None
+                if partial is not None:
+                    self.metrics.add_document_stage_seconds(partial.stage_seconds)
+                yield partial
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _iter_sentences(self, directory_name):
+        """
+        :param directory_name: String representing directory name.
+        :return: generator of TokenizedSentence of every document, split chunk_size bytes at a time.
+            Documents that are not UTF-8 past their start are skipped, the rest of the document once found.
+        """
+        tokenizer = _word_tokenizer()
+        for document in self._list_shard_documents(directory_name):
+            if document.name in self._undecodable:
+                continue
+            chunks = self._iter_document_chunks(document.path, document.name, self._chunk_size, tokenizer)
+            try:
+                for sentences in chunks:
+                    yield from sentences
+            except UnicodeDecodeError:
+                self._undecodable.add(document.name)
+
+    def _list_shard_documents(self, directory_name, unchanged=None):
+        """
+        :param directory_name: String representing directory name.
+        :param unchanged: function of form (path, size, mtime) -> Bool, see DocumentScanner.scan.
+        :return: List of ScannedDocument of the documents of the shard, or all documents.
+        """
+        documents = self._scanner.scan(directory_name, unchanged)
+        if self._shard is None:
+            return documents
+        index, number_of_shards = self._shard
+        return [document for document in documents if self.shard_index(document.name, number_of_shards) == index]
+
+    @staticmethod
+    def _load_partial(partial_path):
+        """
+        :param partial_path: String - path of a partial result file written by save_partial.
+        :return: dict of form {'directory': String, 'chunk_size': Int, 'tag_window': Int,
+            'scanner': DocumentScanner settings, 'deduplicator': SentenceDeduplicator settings or None,
+            'shard': (index, number of shards), 'analysis': DocumentAnalysis}.
+        """
+        with open(partial_path, 'rb') as file:
+            partial = pickle.load(file)
+        if partial.get('version') != DocumentTextExtractor.PARTIAL_VERSION:
+            raise ValueError(f'partial_path: {partial_path} is not a partial result of this version')
+        return partial
+
+    @staticmethod
+    def _tokenize_sentences(document_name, sentences, tokenizer, first_sentence_id=0, byte_spans=None):
+        """
+        :param document_name: String - name of the document.
+        :param sentences: List of Strings - consecutive sentences of the document.
+        :param tokenizer: Tokenizer object used to tokenize sentences.
+        :param first_sentence_id: Int - offset of the first sentence within the document.
+        :param byte_spans: List of tuples of form (byte offset, byte length) of the sentences in the document file.
+        :return: List of TokenizedSentence.
+        """
+        return [
+            TokenizedSentence(document_name, i, sent, [w.lower() for w in tokenizer.tokenize(sent)], *byte_span)
+            for i, (sent, byte_span) in enumerate(zip(sentences, byte_spans or repeat(())), first_sentence_id)
+        ]
+
+    @staticmethod
+    def _iter_document_chunks(document_path, document_name, chunk_size, tokenizer):
+        """
+        Tokenizes the sentences of a document chunk by chunk, see _iter_sentence_spans.
+        :param document_path: String representing path to document.
+        :param document_name: String - name of the document.
+        :param chunk_size: Int - number of bytes split at a time, None splits the whole document at once.
+        :param tokenizer: Tokenizer object used to tokenize sentences.
+        :return: generator of Lists of TokenizedSentence with their byte offset and length, one List for each chunk.
+        """
+        sentence_id = 0
+        for spans in DocumentTextExtractor._iter_sentence_spans(document_path, chunk_size):
+            offsets, ends, sentences = zip(*spans)
+            yield DocumentTextExtractor._tokenize_sentences(
+                document_name, sentences, tokenizer, sentence_id,
+                [(offset, end - offset) for offset, end in zip(offsets, ends)]
+            )
+            sentence_id += len(spans)
+
+    @staticmethod
+    def _iter_sentence_spans(document_path, chunk_size):
+        """
+        Memory-maps a document and splits it on sentence boundaries about chunk_size bytes at a time,
+        decoding only the chunk being split. Chunks end on whitespace so no character is cut in two,
+        or at the start of a character in text without whitespace, such as CJK.
+        The last sentence of a chunk may be incomplete so it is carried over to the next chunk,
+        only a sentence longer than chunk_size makes the chunk grow past it, doubling each time.
+        A sentence still unfinished after MAX_SENTENCE_SIZE bytes, such as a transcript without sentence
+        punctuation, is cut at the chunk's end, so a chunk stays within twice chunk_size plus MAX_SENTENCE_SIZE.
+        :param document_path: String representing path to document.
+        :param chunk_size: Int - number of bytes split at a time, None splits the whole document at once.
+        :return: generator of non empty Lists of tuples of form (byte offset, byte end, sentence),
+            one List for each chunk.
+        """
+        with _map_document(document_path) as buffer:
+            start = end = 0
+            growth = chunk_size
+            while end < len(buffer):
+                if chunk_size is None:
+                    end = len(buffer)
+                else:
+                    limit = start + 2 * (chunk_size + DocumentTextExtractor.MAX_SENTENCE_SIZE)
+                    end = DocumentTextExtractor._chunk_end(buffer, end + growth, limit)
+                spans = DocumentTextExtractor._sentence_byte_spans(buffer, start, end)
+                if end < len(buffer):
+                    if len(spans) < 2 and end - start < chunk_size + DocumentTextExtractor.MAX_SENTENCE_SIZE:
+                        growth *= 2
+                        continue
+                    start = spans.pop()[0] if len(spans) > 1 else end
+                    growth = chunk_size
+                if spans:
+                    yield spans
+
+    @staticmethod
+    def _chunk_end(buffer, position, limit=None):
+        """
+        :param buffer: mmap of a document.
+        :param position: Int - byte offset the chunk should end at.
+        :param limit: Int - byte offset past which no whitespace is looked for, None looks up to the end.
+        :return: Int - offset of the first whitespace byte from position, otherwise of the first character
+            starting from limit or position, whichever is later, or the end of the document.
+        """
+        if position >= len(buffer):
+            return len(buffer)
+        limit = len(buffer) if limit is None else min(max(position, limit), len(buffer))
+        whitespace = _WHITESPACE.search(buffer, position, limit)
+        if whitespace is not None:
+            return whitespace.start()
+        # skip UTF-8 continuation bytes, 0b10xxxxxx, so the cut is at the start of a character
+        while limit < len(buffer) and buffer[limit] & 0xC0 == 0x80:
+            limit += 1
+        return limit
+
+    @staticmethod
+    def _sentence_byte_spans(buffer, start, end):
+        """
+        Splits a slice of a memory-mapped document into sentences.
+        :param buffer: mmap of a document.
+        :param start: Int - byte offset of the slice.
+        :param end: Int - byte offset of the end of the slice.
+        :return: List of tuples of form (byte offset, byte end, sentence) of the sentences in the slice.
+        """
+        with memoryview(buffer) as view:
+            text = str(view[start:end], 'utf-8')
+        spans = sentence_spans(text)
+        if text.isascii():
+            byte_spans = [(start + span_start, start + span_end) for span_start, span_end in spans]
+        else:
+            byte_spans, character, byte = [], 0, start
+            for span_start, span_end in spans:
+                byte += len(text[character:span_start].encode('utf-8'))
+                byte_spans.append((byte, byte + len(text[span_start:span_end].encode('utf-8'))))
+                character, byte = span_end, byte_spans[-1][1]
+        translate = _translate_newlines if '\r' in text else str
+        return [
+            (offset, byte_end, translate(text[span_start:span_end]))
+            for (offset, byte_end), (span_start, span_end) in zip(byte_spans, spans)
+        ]
 
     @staticmethod
     def _create_word_type_following_dict(bigram_tokens):
@@ -106,90 +844,1985 @@ class DocumentTextExtractor:
         return [word for word, follow_types in words_following_dict.items() if len(follow_types) >= number]
 
     @staticmethod
-    def _convert_to_csv_form(word_context_dict):
+    def _create_following_type_masks(word_ids, tag_ids, masks):
         """
-        :param word_context_dict: dict of word contexts in form: {word - String: ['sentence contexts']}
-        :return: list of word contexts in form:
-            [['word', 'sentence context 1'], ['', 'sentence context 2'], , ['word 2', 'sentence context 1']]
+        Vectorized _create_word_type_following_dict over an encoded stream of tagged words.
+        :param word_ids: numpy array of Int word ids of consecutive tagged words.
+        :param tag_ids: numpy array of Int ids in TAGS of the words' types.
+        :param masks: numpy array of bitmasks of following types indexed by word id, bit i set for TAGS[i],
+            updated in place.
+        :return: numpy array - masks.
+        """
+        np.bitwise_or.at(masks, word_ids[:-1], np.left_shift(1, tag_ids[1:]).astype(np.uint16))
+        return masks
+
+    @staticmethod
+    def _find_number_follow_type_ids(follower_masks, number):
+        """
+        Vectorized _find_number_follow_types.
+        :param follower_masks: numpy array of bitmasks of following types indexed by word id.
+        :param number: Int - minimum number of follow types.
+        :return: numpy array of ids of words with follow types >= number, in ascending order.
+            Words never followed by a tagged word, such as punctuation, have no follow types and are never returned.
         """
-        csv_format = []
-        for word, sentences in word_context_dict.items():
-            for i, sentence in enumerate(sentences):
-                csv_format.append([word, sentence] if i == 0 else ['', sentence])
-        return csv_format
+        return np.flatnonzero(_MASK_BIT_COUNTS[follower_masks] >= max(number, 1))
 
     @staticmethod
-    def _export_csv(csv_data):
+    def _convert_to_csv_form(word_context_dict):
         """
-        export data to csv
+        :param word_context_dict: dict of word contexts in form: {word - String: ['sentence contexts']}
+        :return: list of word contexts in form:
+            [['word', 'sentence context 1'], ['', 'sentence context 2'], , ['word 2', 'sentence context 1']]
         """
-        df = pd.DataFrame(csv_data)
-        df.to_csv('interesting_words.csv', index=False, header=['word', 'context'])
+        return [list(row) for row in ContextExporter.rows(word_context_dict)]
 
 
 class WordContextFinder:
 
     @staticmethod
-    def get_word_contexts(sentences, words, word_tokenizer):
+    def get_word_contexts(sentences, words, word_tokenizer, workers=1):
         """
-        Get sentence context for each word in sentence.
+        Get sentence context for each word in sentence, tokenizing only the sentences ContextMatcher matches.
         :param sentences: list of tuples of form (document_name, sentence).
         :param words: list of Strings corresponding to words tokens.
         :param word_tokenizer: Tokenizer class - tokenizer class used to tokenize sentence.
+        :param workers: Int - number of threads the sentences are matched in.
+        :return: dict of form {word - String: ['sentence contexts']}.
+        """
+        return ContextMatcher(words, word_tokenizer()).word_contexts(sentences, workers=workers)
+
+    @staticmethod
+    def get_tokenized_word_contexts(tokenized_sentences, words, deduplicator=None):
+        """
+        Get sentence context for each word in already tokenized sentences.
+        :param tokenized_sentences: iterable of TokenizedSentence.
+        :param words: list of Strings corresponding to words tokens.
+        :param deduplicator: SentenceDeduplicator - when given sentences with the same key are one context,
+            the first of them listing every document they appear in.
         :return: dict of form {word - String: ['sentence contexts']}.
         """
         context_dict = defaultdict(list)
-        lower_case_words = [w.lower() for w in words]
-        for (document, sentence) in sentences:
-            intersection = set(lower_case_words).intersection(
-                set([w.lower() for w in word_tokenizer().tokenize(sentence)])
+        lower_case_words = {w.lower() for w in words}
+        if deduplicator is None:
+            for sentence in tokenized_sentences:
+                for word in lower_case_words.intersection(sentence.words):
+                    context_dict[word].append(f'{sentence.document}: {sentence.sentence}')
+            return context_dict
+        groups = defaultdict(dict)
+        for sentence in tokenized_sentences:
+            found = lower_case_words.intersection(sentence.words)
+            if found:
+                key = deduplicator.key(sentence)
+                for word in found:
+                    groups[word].setdefault(key, (sentence.sentence, {}))[1][sentence.document] = None
+        for word, word_groups in groups.items():
+            context_dict[word] = [f'{", ".join(documents)}: {text}' for text, documents in word_groups.values()]
+        return context_dict
+
+
+class ContextMatcher:
+
+    _REPEATED = re.compile(r'(.)\1{3,}', re.DOTALL)
+    _RUN_OF_THREE = re.compile(r'(.)\1\1', re.DOTALL)
+    _SEPARATOR = '\x00\x01'
+
+    def __init__(self, words, tokenizer=None):
+        """
+        Finds the contexts of words in many sentences at a time with a single compiled regex, tokenizing only
+        the sentences it matches, so the contexts are those found by tokenizing every sentence.
+        TweetTokenizer tokens are not delimited by word boundaries, '<3a' being the tokens '<3' and 'a',
+        so the regex matches the words anywhere in the sentences in lower case, compiled as a trie of the words.
+        As TweetTokenizer shortens runs of punctuation, runs of any character are shortened to 3 in both, and
+        sentences with an '&', which may start an HTML entity, are always tokenized.
+        :param words: iterable of Strings - words to find, matched case insensitively.
+        :param tokenizer: Tokenizer object whose tokens are substrings of the sentence, TweetTokenizer by default.
+        """
+        self._words = {w.lower() for w in words}
+        self._tokenizer = tokenizer or _word_tokenizer()
+        self._shorten = any(self._RUN_OF_THREE.search(word) for word in self._words)
+        folded_words = {self._fold(word) for word in self._words} - {''}
+        # the rest of the sentence is matched too, so each sentence is matched at most once
+        pattern = self._trie_pattern(folded_words | {'&'}) + r'[^\x00]*'
+        self._pattern = re.compile(pattern) if folded_words else None
+
+    def candidates(self, sentences):
+        """
+        :param sentences: List of Strings.
+        :return: numpy array of the indexes of the sentences that may contain the words, in ascending order.
+        """
+        if self._pattern is None or not sentences:
+            return np.zeros(0, dtype=np.int64)
+        folded = self._fold(self._SEPARATOR.join(sentences))
+        if folded.count(self._SEPARATOR) != len(sentences) - 1:
+            # a sentence contains the separator, so they are matched one at a time
+            return np.array(
+                [i for i, sentence in enumerate(sentences) if self._pattern.search(self._fold(sentence))], np.int64
             )
-            for word in intersection:
+        lengths = np.fromiter(map(len, folded.split(self._SEPARATOR)), np.int64, len(sentences))
+        ends = np.cumsum(lengths + len(self._SEPARATOR))
+        positions = np.fromiter((match.start() for match in self._pattern.finditer(folded)), np.int64)
+        return np.unique(np.searchsorted(ends, positions, side='right'))
+
+    def word_contexts(self, sentences, batch_size=100000, workers=1):
+        """
+        :param sentences: list of tuples of form (document_name, sentence).
+        :param batch_size: Int - number of sentences matched at a time.
+        :param workers: Int - number of threads batches are matched in, 1 matches them in this thread.
+        :return: dict of form {word - String: ['sentence contexts']}.
+        """
+        sentences = list(sentences)
+        batches = [sentences[start:start + batch_size] for start in range(0, len(sentences), batch_size)]
+        if workers == 1:
+            batch_contexts = map(self._batch_word_contexts, batches)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                batch_contexts = list(executor.map(self._batch_word_contexts, batches))
+        context_dict = defaultdict(list)
+        for contexts in batch_contexts:
+            for word, word_contexts in contexts.items():
+                context_dict[word].extend(word_contexts)
+        return context_dict
+
+    def _batch_word_contexts(self, sentences):
+        """
+        :param sentences: list of tuples of form (document_name, sentence).
+        :return: dict of form {word - String: ['sentence contexts']}.
+        """
+        context_dict = defaultdict(list)
+        for i in self.candidates([sentence for document, sentence in sentences]).tolist():
+            document, sentence = sentences[i]
+            for word in self._words.intersection([w.lower() for w in self._tokenizer.tokenize(sentence)]):
                 context_dict[word].append(f'{document}: {sentence}')
         return context_dict
 
+    @staticmethod
+    def _trie_pattern(words):
+        """
+        :param words: set of non empty Strings.
+        :return: String - regex matching any of words, branching on one character at a time. Words starting
+            with another word are left out, as matching the shorter one is enough.
+        """
+        trie = {}
+        for word in words:
+            node = trie
+            for character in word:
+                node = node.setdefault(character, {})
+            node[''] = {}
 
-class WordNormalizer:
+        def pattern(node):
+            if '' in node:
+                return ''
+            branches = [re.escape(character) + pattern(child) for character, child in sorted(node.items())]
+            return branches[0] if len(branches) == 1 else f'(?:{"|".join(branches)})'
+        return pattern(trie)
 
-    @staticmethod
-    def remove_from_tokens(tokens, remove_list):
+    def _fold(self, text):
         """
-        :param tokens: List of String objects.
-        :param remove_list: List of String objects - tokens to remove - should be in lower case.
-        :return: List of String objects corresponding to tokens without words from remove_list.
+        :param text: String.
+        :return: String - text in lower case with a final sigma as any other, runs of a character shortened to 3
+            when a word has such a run.
+        """
+        if self._shorten:
+            text = self._REPEATED.sub(r'\1\1\1', text)
+        return text.lower().replace('ς', 'σ')
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_hash(word):
+    """
+    :param word: String.
+    :return: Int - unsigned 64 bit hash of word, the same in every process.
+    """
+    return int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), 'little')
+
+
+class SentenceDeduplicator:
+
+    def __init__(self, max_sentences=1000000, near_duplicates=False, bands=16, rows=4, seed=0):
+        """
+        Gives repeated sentences the same 64 bit key. Exact duplicates have the same text. With near_duplicates
+        a sentence also takes the key of a sentence seen before whose set of words is similar, found by locality
+        sensitive hashing of MinHash signatures: sentences of Jaccard similarity s share the key with probability
+        1 - (1 - s ** rows) ** bands, about a half at s = (1 / bands) ** (1 / rows).
+        Memory is bounded by max_sentences, the number of sentences remembered by the deduplicator and by
+        each SentenceIndex. The least recently seen are forgotten first, their next copies counting as new.
+        :param max_sentences: Int - number of distinct sentences remembered.
+        :param near_duplicates: Bool - whether sentences with similar words are duplicates too.
+        :param bands: Int - number of bands of rows hashes the MinHash signatures are split into.
+        :param rows: Int - number of hashes in each band, more rows require a higher similarity.
+        :param seed: Int - seed of the hash functions, so keys are the same in every process.
+        """
+        self.max_sentences = max_sentences
+        self.near_duplicates = near_duplicates
+        self.bands = bands
+        self.rows = rows
+        self._seed = seed
+        rng = np.random.default_rng(seed)
+        self._multipliers = rng.integers(0, 1 << 64, bands * rows, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self._increments = rng.integers(0, 1 << 64, bands * rows, dtype=np.uint64, endpoint=False)
+        self._seen_bands = OrderedDict()
+
+    @property
+    def settings(self):
+        """
+        :return: tuple of the settings the keys depend on.
+        """
+        return self.max_sentences, self.near_duplicates, self.bands, self.rows, self._seed
+
+    def key(self, sentence):
         """
-        return [token for token in tokens if token.lower() not in remove_list]
+        :param sentence: TokenizedSentence.
+        :return: Int - signed 64 bit key of the sentence, that of the first near duplicate seen with near_duplicates.
+        """
+        return self.resolve(self.exact_key(sentence), self.band_keys(sentence), self._seen_bands)
 
     @staticmethod
-    def word_tagger(tokens):
+    def exact_key(sentence):
         """
-        :param tokens: List Strings corresponding to word tokens
-        :return: List of tuples in form (word, word type)
+        :param sentence: TokenizedSentence.
+        :return: Int - signed 64 bit hash of the sentence's text.
         """
-        return pos_tag(tokens, tagset='universal')
+        digest = hashlib.blake2b(sentence.sentence.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little', signed=True)
 
-    def normalize_words(self, word_tokens):
+    def band_keys(self, sentence):
         """
-        - removes punctuation from words
-        - tags words with word types
-        - creates bigram of in form tuples (word, word_type)
-        :param word_tokens: List Strings representing words
-        :return: list bigrams of (word, word_type) e.g. [((hammer, NOUN), (hard, ADJECTIVE))]
+        :param sentence: TokenizedSentence.
+        :return: List of Ints - signed 64 bit hashes of the bands of the MinHash signature of the sentence's words,
+            empty without near_duplicates or words.
+        """
+        if not self.near_duplicates or not sentence.words:
+            return []
+        return self._band_keys(set(sentence.words))
+
+    def resolve(self, key, band_keys, seen_bands):
+        """
+        :param key: Int - exact key of a sentence.
+        :param band_keys: List of Ints - band keys of the sentence.
+        :param seen_bands: OrderedDict of the key of the first sentence seen with each band key, updated in place
+            and bounded by max_sentences.
+        :return: Int - key of the first sentence seen sharing a band key, key when there is none.
         """
-        no_punct_tokens = self.remove_from_tokens(word_tokens, list(punctuation) + ['’', '—'])
-        tagged_tokens = self.word_tagger(no_punct_tokens)
-        return bigrams(tagged_tokens)
+        for band_key in band_keys:
+            first_key = seen_bands.get(band_key)
+            if first_key is not None:
+                seen_bands.move_to_end(band_key)
+                return first_key
+        for band_key in band_keys:
+            seen_bands[band_key] = key
+        while len(seen_bands) > self.max_sentences * self.bands:
+            seen_bands.popitem(last=False)
+        return key
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_seen_bands'] = OrderedDict()
+        return state
 
-class WordCounter:
+    def _band_keys(self, words):
+        """
+        :param words: set of Strings - words of a sentence.
+        :return: List of Ints - signed 64 bit hashes of the bands of the MinHash signature of words.
+        """
+        word_hashes = np.fromiter(map(_word_hash, words), np.uint64, len(words))
+        signature = (word_hashes[:, np.newaxis] * self._multipliers + self._increments).min(axis=0)
+        return [
+            int.from_bytes(
+                hashlib.blake2b(band.tobytes(), digest_size=8, person=band_number.to_bytes(2, 'little')).digest(),
+                'little', signed=True
+            )
+            for band_number, band in enumerate(signature.reshape(self.bands, self.rows))
+        ]
 
-    @staticmethod
-    def most_common_words(all_tokens, interesting_words, number):
+
+class SentenceIndex:
+
+    def __init__(self, deduplicator=None):
         """
-        :param all_tokens: list of String objects representing all tokens.
-        :param interesting_words: list of String objects representing words to be counted.
-        :param number: int number of most common words to be returned.
-        :return: list - most common words ordered alphabetically.
+        Inverted index from lower case word tokens to the sentences they appear in.
+        Sentences are numbered in the order they are added and postings are arrays of sentence numbers,
+        each document's sentences being numbered consecutively from its sentence_id 0.
+        Sentences read from a document file are kept as their byte offset and length in the file
+        and only read again when looked up, other sentences are kept as Strings.
+        With a deduplicator each sentence also keeps the number of the first sentence with its key, and
+        the contexts of a word list each repeated sentence once with every document it appears in.
+        With near_duplicates each sentence also keeps its exact key and band keys, 8 * (bands + 1) bytes,
+        so merged indexes find near duplicates as a single index over their sentences in merge order would.
+        :param deduplicator: SentenceDeduplicator the sentences' keys are found with.
+        """
+        self._set_deduplicator(deduplicator)
+        self._postings = {}
+        self._sentence_documents = array('i')
+        self._sentence_offsets = array('q')
+        self._sentence_lengths = array('i')
+        self._texts = {}
+        self._document_names = []
+        self._document_starts = {}
+        self._document_paths = {}
+        self._document_stats = {}
+
+    def __len__(self):
+        return len(self._sentence_documents)
+
+    def _set_deduplicator(self, deduplicator):
+        """
+        :param deduplicator: SentenceDeduplicator the keys of the sentences, none yet, are found with.
+        """
+        near_duplicates = deduplicator is not None and deduplicator.near_duplicates
+        self._deduplicator = deduplicator
+        self._sentence_keys = None if deduplicator is None else array('q')
+        self._first_numbers = None if deduplicator is None else array('i')
+        self._numbers_by_key = OrderedDict()
+        self._exact_keys = array('q') if near_duplicates else None
+        self._sentence_band_keys = array('q') if near_duplicates else None
+        self._seen_bands = OrderedDict()
+
+    def add_document(self, document, document_path):
+        """
+        :param document: String - name of the document.
+        :param document_path: String - path of the file its sentences' byte offsets refer to,
+            its size and modification time are kept to tell when the offsets no longer hold.
+        """
+        stat = os.stat(document_path)
+        self._document_paths[document] = document_path
+        self._document_stats[document] = stat.st_size, stat.st_mtime_ns
+
+    def touch_document(self, document_path):
+        """
+        Keeps the byte offsets of the documents read from document_path valid once the file was found to have
+        only a new modification time, so changed_documents no longer reports them.
+        :param document_path: String - path of the file.
+        """
+        stat = os.stat(document_path)
+        for document, path in self._document_paths.items():
+            if path == document_path:
+                self._document_stats[document] = stat.st_size, stat.st_mtime_ns
+
+    def add(self, tokenized_sentence):
+        """
+        :param tokenized_sentence: TokenizedSentence - sentence to index, added in document order.
+        """
+        number = len(self)
+        document = tokenized_sentence.document
+        if document not in self._document_starts:
+            self._document_starts[document] = number - tokenized_sentence.sentence_id
+            self._document_names.append(document)
+        self._sentence_documents.append(len(self._document_names) - 1)
+        if tokenized_sentence.offset is None or document not in self._document_paths:
+            self._texts[number] = tokenized_sentence.sentence
+            self._sentence_offsets.append(-1)
+            self._sentence_lengths.append(0)
+        else:
+            self._sentence_offsets.append(tokenized_sentence.offset)
+            self._sentence_lengths.append(tokenized_sentence.length)
+        if self._deduplicator is not None:
+            exact_key = self._deduplicator.exact_key(tokenized_sentence)
+            self._add_key(exact_key, self._deduplicator.band_keys(tokenized_sentence), number)
+        for word in set(tokenized_sentence.words):
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = array('i')
+            postings.append(number)
+
+    def merge(self, other):
+        """
+        Appends the postings and sentences of an index built over other documents.
+        Sentences of other with the key of a sentence of this index become its duplicates, with near_duplicates
+        the keys of other's sentences are found again after this index's sentences.
+        :param other: SentenceIndex - index of documents not in this index.
+        """
+        if (self._deduplicator is None) != (other._deduplicator is None):
+            if len(self) or other._deduplicator is None:
+                raise ValueError('other: only indexes that are both deduplicated or both not can be merged')
+            self._set_deduplicator(other._deduplicator)
+        sentence_offset, document_offset = len(self), len(self._document_names)
+        if self._sentence_band_keys is not None:
+            bands = self._deduplicator.bands
+            for number, exact_key in enumerate(other._exact_keys):
+                band_keys = other._sentence_band_keys[number * bands:(number + 1) * bands]
+                self._add_key(exact_key, band_keys if any(band_keys) else [], number + sentence_offset)
+        elif self._deduplicator is not None:
+            self._merge_keys(other, sentence_offset)
+        self._sentence_documents.extend(document + document_offset for document in other._sentence_documents)
+        self._sentence_offsets += other._sentence_offsets
+        self._sentence_lengths += other._sentence_lengths
+        self._texts.update((number + sentence_offset, text) for number, text in other._texts.items())
+        self._document_names += other._document_names
+        self._document_paths.update(other._document_paths)
+        self._document_stats.update(other._document_stats)
+        for document, start in other._document_starts.items():
+            self._document_starts[document] = start + sentence_offset
+        for word, postings in other._postings.items():
+            shifted = np.frombuffer(postings, dtype=np.int32) + sentence_offset
+            self._postings.setdefault(word, array('i')).frombytes(shifted.astype(np.int32).tobytes())
+
+    def changed_documents(self):
+        """
+        :return: List of Strings - names of the documents whose sentences are read by byte offset and whose file
+            was deleted, or changed size or modification time, since it was indexed.
+        """
+        changed = []
+        for document, document_path in self._document_paths.items():
+            try:
+                stat = os.stat(document_path)
+            except OSError:
+                changed.append(document)
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != self._document_stats[document]:
+                changed.append(document)
+        return changed
+
+    @property
+    def number_of_duplicates(self):
+        """
+        :return: Int - number of sentences that repeat a sentence before them, 0 without a deduplicator.
+        """
+        if self._deduplicator is None:
+            return 0
+        return int(np.count_nonzero(np.frombuffer(self._first_numbers, dtype=np.int32) != np.arange(len(self))))
+
+    def sentences(self):
+        """
+        :return: generator of tuples of form (document, sentence) for every indexed sentence in the order added.
+        """
+        numbers = range(len(self))
+        documents = (self._document_names[document] for document in self._sentence_documents)
+        return zip(documents, self._read_sentences(numbers))
+
+    def postings(self, word):
+        """
+        :param word: String - word token, matched case insensitively.
+        :return: list of tuples of form (document, sentence_id) for sentences containing the word.
+        """
+        postings = []
+        for number in self._postings.get(word.lower(), ()):
+            document = self._document_names[self._sentence_documents[number]]
+            postings.append((document, number - self._document_starts[document]))
+        return postings
+
+    def sentence(self, document, sentence_id):
+        """
+        :param document: String - name of the document.
+        :param sentence_id: Int - offset of the sentence within the document.
+        :return: String - the sentence.
+        """
+        return next(self._read_sentences([self._document_starts[document] + sentence_id]))
+
+    def get_word_contexts(self, words):
+        """
+        Get sentence context for each word from its postings, reading only these sentences.
+        :param words: list of Strings corresponding to words tokens.
+        :return: dict of form {word - String: ['sentence contexts']}.
         """
-        freq_dist = FreqDist([t for t in all_tokens if t in interesting_words]).most_common(number)
-        return sorted(w for (w, freq) in freq_dist)
+        words = list(dict.fromkeys(w.lower() for w in words))
+        groups = [self._duplicate_groups(self._postings.get(word, ())) for word in words]
+        sentence_numbers = sorted({group[0] for word_groups in groups for group in word_groups})
+        sentences = dict(zip(sentence_numbers, self._read_sentences(sentence_numbers)))
+        context_dict = defaultdict(list)
+        for word, word_groups in zip(words, groups):
+            for group in word_groups:
+                context_dict[word].append(self._context(group, sentences[group[0]]))
+        return context_dict
+
+    def iter_word_contexts(self, words, max_contexts=None):
+        """
+        Lazy get_word_contexts, each word's sentences are only read as its contexts are consumed.
+        :param words: list of Strings corresponding to words tokens.
+        :param max_contexts: Int - maximum number of contexts of each word, the first in document order.
+        :return: generator of tuples of form (word, generator of Strings - 'sentence contexts')
+            for the words that appear in a sentence.
+        """
+        for word in dict.fromkeys(w.lower() for w in words):
+            numbers = self._postings.get(word)
+            if numbers:
+                if self._deduplicator is None:
+                    groups = [[number] for number in numbers[:max_contexts]]
+                else:
+                    groups = self._duplicate_groups(numbers)[:max_contexts]
+                yield word, self._iter_contexts(groups)
+
+    def _iter_contexts(self, groups):
+        """
+        :param groups: List of Lists of Int sentence numbers, see _duplicate_groups, by first number ascending.
+        :return: generator of Strings of form 'documents: sentence'.
+        """
+        for group, sentence in zip(groups, self._read_sentences(group[0] for group in groups)):
+            yield self._context(group, sentence)
+
+    def _context(self, numbers, sentence):
+        """
+        :param numbers: List of Int numbers of copies of a sentence.
+        :param sentence: String - the first copy.
+        :return: String of form 'document: sentence', or 'document, other document: sentence'
+            when the copies are in several documents.
+        """
+        documents = dict.fromkeys(self._document_names[self._sentence_documents[number]] for number in numbers)
+        return f'{", ".join(documents)}: {sentence}'
+
+    def _duplicate_groups(self, numbers):
+        """
+        :param numbers: iterable of Int sentence numbers in ascending order, e.g. the postings of a word.
+        :return: List of Lists of the numbers, copies of the same sentence in one List, ordered by their first.
+        """
+        if self._deduplicator is None:
+            return [[number] for number in numbers]
+        groups = {}
+        for number in numbers:
+            groups.setdefault(self._first_numbers[number], []).append(number)
+        return list(groups.values())
+
+    def _add_key(self, exact_key, band_keys, number):
+        """
+        :param exact_key: Int - exact key of the sentence added.
+        :param band_keys: List of Ints - band keys of the sentence, empty without near_duplicates or words.
+        :param number: Int - number of the sentence.
+        """
+        key = self._deduplicator.resolve(exact_key, band_keys, self._seen_bands)
+        self._sentence_keys.append(key)
+        self._first_numbers.append(self._first_number(key, number))
+        if self._sentence_band_keys is not None:
+            self._exact_keys.append(exact_key)
+            self._sentence_band_keys.extend(band_keys or [0] * self._deduplicator.bands)
+
+    def _first_number(self, key, number):
+        """
+        :param key: Int - key of the sentence.
+        :param number: Int - number of the sentence.
+        :return: Int - number of the first sentence remembered with key, number when there is none.
+        """
+        first_number = self._numbers_by_key.get(key)
+        if first_number is not None:
+            self._numbers_by_key.move_to_end(key)
+            return first_number
+        self._numbers_by_key[key] = number
+        if len(self._numbers_by_key) > self._deduplicator.max_sentences:
+            self._numbers_by_key.popitem(last=False)
+        return number
+
+    def _merge_keys(self, other, sentence_offset):
+        """
+        Appends the keys of other's sentences, its first sentences of each key becoming duplicates
+        of sentences of this index with the same key.
+        :param other: SentenceIndex - deduplicated index of documents not in this index.
+        :param sentence_offset: Int - number of sentences of this index before the merge.
+        """
+        other_first_numbers = np.frombuffer(other._first_numbers, dtype=np.int32)
+        first_numbers = np.arange(len(other), dtype=np.int32) + sentence_offset
+        for number in np.flatnonzero(other_first_numbers == np.arange(len(other))).tolist():
+            first_numbers[number] = self._first_number(other._sentence_keys[number], number + sentence_offset)
+        self._sentence_keys += other._sentence_keys
+        self._first_numbers.frombytes(first_numbers[other_first_numbers].tobytes())
+
+    def _read_sentences(self, numbers):
+        """
+        Reads sentences kept as byte offsets from their memory-mapped documents, each document mapped once
+        for consecutive sentences of the same document.
+        :param numbers: iterable of Int sentence numbers.
+        :return: generator of Strings - the sentences in the order of numbers.
+        """
+        for document, document_numbers in groupby(numbers, self._sentence_documents.__getitem__):
+            document_path = self._document_paths.get(self._document_names[document])
+            if document_path is None:
+                yield from (self._texts[number] for number in document_numbers)
+                continue
+            with _map_document(document_path) as buffer:
+                for number in document_numbers:
+                    offset = self._sentence_offsets[number]
+                    if offset < 0:
+                        yield self._texts[number]
+                    else:
+                        yield _decode(buffer, offset, offset + self._sentence_lengths[number])
+
+
+class ContextExporter:
+
+    FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.json': 'jsonl', '.parquet': 'parquet'}
+
+    def __init__(self, output='interesting_words.csv', output_format=None, max_contexts=None, buffer_rows=10000):
+        """
+        Writes word contexts as rows of form (word, context) while they are produced, buffer_rows at a time,
+        without holding every row in memory.
+        In csv the word is only written on its first row, as in a table, JSON lines and Parquet repeat it on every row.
+        Parquet needs pyarrow, which is imported on first use.
+        :param output: String path or file object, a text file for csv and JSON lines, a binary file for Parquet.
+        :param output_format: String - 'csv', 'jsonl' or 'parquet', by default taken from the extension of output,
+            csv when output is a file object.
+        :param max_contexts: Int - maximum number of contexts written for each word, None writes all.
+        :param buffer_rows: Int - number of rows written at a time.
+        """
+        if output_format is None:
+            extension = os.path.splitext(output)[1].lower() if isinstance(output, (str, os.PathLike)) else '.csv'
+            if extension not in self.FORMATS:
+                raise ValueError(f'output: cannot tell the format of {output!r}, give output_format')
+            output_format = self.FORMATS[extension]
+        if output_format not in set(self.FORMATS.values()):
+            raise ValueError(f'output_format: expected csv, jsonl or parquet, got {output_format!r}')
+        self._output = output
+        self._output_format = output_format
+        self._max_contexts = max_contexts
+        self._buffer_rows = buffer_rows
+
+    def export(self, word_contexts):
+        """
+        :param word_contexts: dict of form {word - String: iterable of 'sentence contexts'},
+            or iterable of tuples of form (word, iterable of 'sentence contexts') such as
+            SentenceIndex.iter_word_contexts returns.
+        :return: Int - number of rows written.
+        """
+        rows = self.rows(word_contexts, self._max_contexts, repeat_word=self._output_format != 'csv')
+        batches = iter(lambda: list(islice(rows, self._buffer_rows)), [])
+        write = getattr(self, f'_write_{self._output_format}')
+        if self._output_format == 'parquet' or not isinstance(self._output, (str, os.PathLike)):
+            return write(self._output, batches)
+        with open(self._output, 'w', newline='', encoding='utf-8') as file:
+            return write(file, batches)
+
+    @staticmethod
+    def rows(word_contexts, max_contexts=None, repeat_word=False):
+        """
+        :param word_contexts: dict of form {word - String: iterable of 'sentence contexts'},
+            or iterable of tuples of form (word, iterable of 'sentence contexts').
+        :param max_contexts: Int - maximum number of contexts of each word, None keeps all.
+        :param repeat_word: Bool - whether the word is on every row rather than only its first.
+        :return: generator of tuples of form (word, sentence context), e.g.
+            ('word', 'sentence context 1'), ('', 'sentence context 2'), ('word 2', 'sentence context 1').
+        """
+        items = word_contexts.items() if hasattr(word_contexts, 'items') else word_contexts
+        for word, sentences in items:
+            for i, sentence in enumerate(islice(sentences, max_contexts)):
+                yield (word if i == 0 or repeat_word else '', sentence)
+
+    @staticmethod
+    def _write_csv(file, batches):
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(['word', 'context'])
+        number_of_rows = 0
+        for batch in batches:
+            writer.writerows(batch)
+            number_of_rows += len(batch)
+        return number_of_rows
+
+    @staticmethod
+    def _write_jsonl(file, batches):
+        number_of_rows = 0
+        for batch in batches:
+            file.write(''.join(
+                json.dumps({'word': word, 'context': context}, ensure_ascii=False) + '\n' for word, context in batch
+            ))
+            number_of_rows += len(batch)
+        return number_of_rows
+
+    @staticmethod
+    def _write_parquet(output, batches):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([('word', pa.string()), ('context', pa.string())])
+        number_of_rows = 0
+        with pq.ParquetWriter(output, schema) as writer:
+            for batch in batches:
+                words, contexts = zip(*batch)
+                writer.write_table(pa.Table.from_arrays([pa.array(words), pa.array(contexts)], schema=schema))
+                number_of_rows += len(batch)
+        return number_of_rows
+
+
+class Vocabulary:
+
+    def __init__(self, words=()):
+        """
+        Maps words to consecutive Int ids in order of first occurrence.
+        :param words: iterable of Strings added to the vocabulary.
+        """
+        self._ids = {}
+        self._words = []
+        self.encode(words)
+
+    def __len__(self):
+        return len(self._words)
+
+    def encode(self, words):
+        """
+        :param words: iterable of Strings, words not yet in the vocabulary are added.
+        :return: numpy array of the Int ids of the words.
+        """
+        ids = self._ids
+        size = len(ids)
+        encoded = np.fromiter((ids.setdefault(word, len(ids)) for word in words), dtype=np.int32)
+        if len(ids) > size:
+            self._words += reversed(list(islice(reversed(ids), len(ids) - size)))
+        return encoded
+
+    def lookup(self, words):
+        """
+        :param words: iterable of Strings.
+        :return: numpy array of the Int ids of the words in the vocabulary, unknown words are left out.
+        """
+        return np.array([self._ids[word] for word in words if word in self._ids], dtype=np.int32)
+
+    def decode(self, word_ids):
+        """
+        :param word_ids: iterable of Int word ids.
+        :return: List of Strings - the words.
+        """
+        return [self._words[word_id] for word_id in word_ids]
+
+
+class DocumentAnalysis:
+
+    def __init__(self, tag_window=0, deduplicator=None):
+        """
+        Partial result of analysing documents, encoded over its own Vocabulary:
+        - counts: numpy array of token counts indexed by word id.
+        - follower_masks: numpy array of bitmasks of the types following each word, bit i set for TAGS[i].
+        - tag_windows: TagWindowCounts of the types up to tag_window words before and after each word within
+            its sentence, None when tag_window is 0.
+        - token_ids: numpy array of the word ids of the token stream of the indexed sentences.
+        - sentence_index: SentenceIndex of the sentences.
+        - number_of_sentences: Int - number of sentences analysed, indexed or not.
+        - stage_seconds: dict of form {stage - String: seconds - Float} of the time spent analysing these
+            documents, not merged as partials are usually analysed in other processes.
+        Partials of different documents are combined with merge.
+        :param tag_window: Int - number of words before and after each word whose types are counted.
+        :param deduplicator: SentenceDeduplicator repeated sentences of the sentence index are found with.
+        """
+        self.vocabulary = Vocabulary()
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._follower_masks = np.zeros(0, dtype=np.uint16)
+        self.tag_windows = TagWindowCounts(tag_window) if tag_window else None
+        self._token_id_chunks = []
+        self.sentence_index = SentenceIndex(deduplicator)
+        self.number_of_sentences = 0
+        self.stage_seconds = defaultdict(float)
+
+    @property
+    def counts(self):
+        return self._counts[:len(self.vocabulary)]
+
+    @property
+    def follower_masks(self):
+        return self._follower_masks[:len(self.vocabulary)]
+
+    @property
+    def token_ids(self):
+        if len(self._token_id_chunks) > 1:
+            self._token_id_chunks = [np.concatenate(self._token_id_chunks)]
+        return self._token_id_chunks[0] if self._token_id_chunks else np.zeros(0, dtype=np.int32)
+
+    @property
+    def token_counts(self):
+        """
+        :return: dict of form {word - String: count - Int} in order of first occurrence.
+        """
+        return dict(zip(self.vocabulary.decode(range(len(self.vocabulary))), self.counts.tolist()))
+
+    @property
+    def following_types(self):
+        """
+        :return: dict of form {word - String: {following types}} for words followed by a tagged word.
+        """
+        word_ids = np.flatnonzero(self.follower_masks)
+        return {
+            word: {tag for i, tag in enumerate(TAGS) if mask >> i & 1}
+            for word, mask in zip(self.vocabulary.decode(word_ids), self.follower_masks[word_ids].tolist())
+        }
+
+    def add_sentences(
+        self, tokenized_sentences, index_sentences=True, previous_tagged_word=None, tagging_backend=None
+    ):
+        """
+        Counts and tags consecutive sentences of a document and records the types following each word.
+        :param tokenized_sentences: iterable of TokenizedSentence of a single document.
+        :param index_sentences: Bool - whether the sentences are added to the sentence index and token stream.
+        :param previous_tagged_word: tuple of form (word, word type) - last tagged word of the sentences
+            before these, so bigrams continue across chunks of a streamed document.
+        :param tagging_backend: tagging backend passed on to WordNormalizer.
+        :return: tuple of form (word, word type) - last tagged word, to pass on with the next sentences.
+        """
+        sentences_words = []
+        with _timed(self.stage_seconds, 'index'):
+            for sentence in tokenized_sentences:
+                if index_sentences:
+                    self.sentence_index.add(sentence)
+                sentences_words.append(sentence.words)
+        self.number_of_sentences += len(sentences_words)
+        with _timed(self.stage_seconds, 'count'):
+            self.count_tokens(
+                [word for words in sentences_words for word in words], keep_token_stream=index_sentences
+            )
+        with _timed(self.stage_seconds, 'tag'):
+            tagged_words = WordNormalizer(tagging_backend).tag_sentences(sentences_words)
+        if previous_tagged_word is not None:
+            tagged_words.insert(0, previous_tagged_word)
+        with _timed(self.stage_seconds, 'followers'):
+            sentence_lengths = None
+            if self.tag_windows is not None:
+                punctuation_filter = TokenFilter.punctuation_filter()
+                sentence_lengths = [len(punctuation_filter.remove(words, lower_case=True)) for words in sentences_words]
+            self.add_tagged_words(tagged_words, sentence_lengths)
+        return tagged_words[-1] if tagged_words else previous_tagged_word
+
+    def count_tokens(self, word_tokens, keep_token_stream=True):
+        """
+        :param word_tokens: List of Strings representing words in lower case.
+        :param keep_token_stream: Bool - whether the encoded tokens are appended to token_ids.
+        """
+        token_ids = self.vocabulary.encode(word_tokens)
+        self._grow()
+        word_ids, counts = np.unique(token_ids, return_counts=True)
+        self._counts[word_ids] += counts
+        if keep_token_stream:
+            self._token_id_chunks.append(token_ids)
+
+    def add_tagged_words(self, tagged_words, sentence_lengths=None):
+        """
+        Records the type of each tagged word as following the word before it.
+        With tag_windows and sentence_lengths the types around each word within its sentence are counted too.
+        :param tagged_words: List of tuples in form (word, word type) of consecutive words.
+        :param sentence_lengths: List of Ints - number of tagged words in each sentence, for the last
+            sum(sentence_lengths) of tagged_words, so a word carried over from previous sentences is left out.
+        """
+        if len(tagged_words) < 2:
+            return
+        word_ids = self.vocabulary.encode(word for word, tag in tagged_words)
+        self._grow()
+        tag_ids = np.array([TAG_IDS[tag] for word, tag in tagged_words], dtype=np.uint16)
+        DocumentTextExtractor._create_following_type_masks(word_ids, tag_ids, self._follower_masks)
+        if self.tag_windows is not None and sentence_lengths is not None:
+            number_of_words = sum(sentence_lengths)
+            self.tag_windows.add(word_ids[-number_of_words:], tag_ids[-number_of_words:], sentence_lengths)
+
+    def merge(self, other):
+        """
+        Reduces the partial result of other documents into this one.
+        :param other: DocumentAnalysis - partial result of documents not in this one, of the same tag window.
+        :return: DocumentAnalysis - self.
+        """
+        windows = [0 if analysis.tag_windows is None else analysis.tag_windows.window for analysis in (self, other)]
+        if windows[0] != windows[1]:
+            raise ValueError(f'other: can only merge analyses of the same tag window {windows[0]}, got {windows[1]}')
+        id_map = self.vocabulary.encode(other.vocabulary.decode(range(len(other.vocabulary))))
+        self._grow()
+        self._counts[id_map] += other.counts
+        self._follower_masks[id_map] |= other.follower_masks
+        if other.tag_windows is not None:
+            self.tag_windows.merge(other.tag_windows, id_map)
+        self.number_of_sentences += other.number_of_sentences
+        if len(other.token_ids):
+            self._token_id_chunks.append(id_map[other.token_ids])
+        self.sentence_index.merge(other.sentence_index)
+        return self
+
+    def _grow(self):
+        """
+        Grows the arrays indexed by word id to the size of the vocabulary, doubling their capacity.
+        """
+        size = len(self.vocabulary)
+        if size > len(self._counts):
+            capacity = max(size, 2 * len(self._counts))
+            self._counts = np.concatenate([self._counts, np.zeros(capacity - len(self._counts), np.int64)])
+            self._follower_masks = np.concatenate(
+                [self._follower_masks, np.zeros(capacity - len(self._follower_masks), np.uint16)]
+            )
+        if self.tag_windows is not None:
+            self.tag_windows.grow(size)
+
+
+class TagWindowCounts:
+
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self, window=1):
+        """
+        Counts of the types of the words up to window words after and before each word, within its sentence,
+        updated from integer arrays of word and tag ids a chunk of sentences at a time.
+        - counts: numpy array of shape (words, 2, window, len(TAGS)) indexed by word id, where
+            counts[word, 0, distance - 1, tag] is the number of times a word of type TAGS[tag] is distance words
+            after the word and counts[word, 1, distance - 1, tag] the number of times it is distance words before.
+        The counts are kept as uint32 in blocks of BLOCK_SIZE words, only the last block growing by doubling,
+        so growing never copies more than a block. counts assembles them when asked for.
+        :param window: Int - largest distance counted.
+        """
+        self.window = window
+        self._blocks = []
+        self._size = 0
+
+    @property
+    def counts(self):
+        if not self._blocks:
+            return np.zeros((0, 2, self.window, len(TAGS)), dtype=np.uint32)
+        return np.concatenate(self._blocks)[:self._size]
+
+    def grow(self, size):
+        """
+        :param size: Int - number of words the counts grow to.
+        """
+        while size > sum(map(len, self._blocks)):
+            last = self._blocks[-1] if self._blocks else None
+            if last is not None and len(last) < self.BLOCK_SIZE:
+                length = min(max(size - (len(self._blocks) - 1) * self.BLOCK_SIZE, 2 * len(last)), self.BLOCK_SIZE)
+                self._blocks[-1] = np.concatenate([last, np.zeros((length - len(last),) + last.shape[1:], np.uint32)])
+            else:
+                length = min(size - len(self._blocks) * self.BLOCK_SIZE, self.BLOCK_SIZE)
+                self._blocks.append(np.zeros((length, 2, self.window, len(TAGS)), np.uint32))
+        self._size = max(self._size, size)
+
+    def add(self, word_ids, tag_ids, sentence_lengths):
+        """
+        :param word_ids: numpy array of Int word ids of consecutive tagged words, all below the grown size.
+        :param tag_ids: numpy array of Int ids in TAGS of the words' types.
+        :param sentence_lengths: List of Ints - number of words in each sentence, summing to len(word_ids).
+        """
+        sentences = np.repeat(np.arange(len(sentence_lengths)), sentence_lengths)
+        word_ids, tag_ids = word_ids.astype(np.int64), tag_ids.astype(np.int64)
+        keys = []
+        for distance in range(1, self.window + 1):
+            same_sentence = sentences[:-distance] == sentences[distance:]
+            words, following_words = word_ids[:-distance][same_sentence], word_ids[distance:][same_sentence]
+            tags, following_tags = tag_ids[:-distance][same_sentence], tag_ids[distance:][same_sentence]
+            keys.append(self._key(words, 0, distance, following_tags))
+            keys.append(self._key(following_words, 1, distance, tags))
+        keys, counts = np.unique(np.concatenate(keys), return_counts=True)
+        block_keys = self._key(self.BLOCK_SIZE, 0, 1, 0)
+        for block, start, end in self._block_runs(keys // block_keys):
+            self._blocks[block].reshape(-1)[keys[start:end] - block * block_keys] += counts[start:end].astype(np.uint32)
+
+    def merge(self, other, id_map):
+        """
+        :param other: TagWindowCounts of other documents, of the same window.
+        :param id_map: numpy array of the ids in this vocabulary of the other vocabulary's words.
+        """
+        if other.window != self.window:
+            raise ValueError(f'other: can only merge counts of the same window, got {other.window}')
+        self.grow(int(id_map.max()) + 1 if len(id_map) else 0)
+        for number, other_block in enumerate(other._blocks):
+            word_ids = id_map[number * self.BLOCK_SIZE:(number + 1) * self.BLOCK_SIZE]
+            order = np.argsort(word_ids // self.BLOCK_SIZE, kind='stable')
+            word_ids, rows = word_ids[order], other_block[:len(word_ids)][order]
+            for block, start, end in self._block_runs(word_ids // self.BLOCK_SIZE):
+                self._blocks[block][word_ids[start:end] - block * self.BLOCK_SIZE] += rows[start:end]
+
+    def distribution(self, distance=1, following=True):
+        """
+        :param distance: Int - distance from the word, from 1 to window.
+        :param following: Bool - whether the types of following words are counted, rather than preceding ones.
+        :return: numpy array of shape (words, len(TAGS)) of the counts of each type at that distance.
+        """
+        direction = 0 if following else 1
+        if not self._blocks:
+            return np.zeros((0, len(TAGS)), dtype=np.uint32)
+        return np.concatenate([block[:, direction, distance - 1] for block in self._blocks])[:self._size]
+
+    def cardinality(self, distance=1, following=True):
+        """
+        :return: numpy array of the number of different types at that distance, indexed by word id.
+        """
+        return np.count_nonzero(self.distribution(distance, following), axis=1)
+
+    def entropy(self, distance=1, following=True):
+        """
+        :return: numpy array of the Shannon entropy in bits of the types at that distance, indexed by word id,
+            0 for words without a word at that distance.
+        """
+        counts = self.distribution(distance, following).astype(np.float64)
+        totals = counts.sum(axis=1, keepdims=True)
+        probabilities = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+        information = np.log2(np.divide(1, probabilities, out=np.ones_like(probabilities), where=probabilities > 0))
+        return (probabilities * information).sum(axis=1)
+
+    def _key(self, word_ids, direction, distance, tag_ids):
+        """
+        :return: numpy array of the flat indexes in counts of the words, direction, distance and tags.
+        """
+        return ((word_ids * 2 + direction) * self.window + distance - 1) * len(TAGS) + tag_ids
+
+    @staticmethod
+    def _block_runs(blocks):
+        """
+        :param blocks: numpy array of Int block numbers in ascending order.
+        :return: generator of tuples of form (block, start, end) of the runs of equal block numbers.
+        """
+        starts = np.flatnonzero(np.diff(blocks, prepend=-1)).tolist()
+        for start, end in zip(starts, starts[1:] + [len(blocks)]):
+            yield int(blocks[start]), start, end
+
+
+class CorpusAnalysis:
+
+    def __init__(self, analysis):
+        """
+        Read only view of the merged DocumentAnalysis of a corpus, answering queries for any number of
+        following types and most common number without going over the documents again.
+        Words are kept sorted by their number of following types so the words with at least N types
+        are found with a binary search.
+        - vocabulary: Vocabulary of the corpus.
+        - counts: read only numpy array of token counts indexed by word id.
+        - follower_counts: read only numpy array of the number of types following each word, indexed by word id.
+        - sentence_index: SentenceIndex of the sentences, empty when the documents were streamed.
+        - number_of_sentences: Int - number of sentences analysed.
+        - tag_windows: TagWindowCounts of the corpus, None when it was analysed without a tag window.
+        The vocabulary, sentence index and tag windows are shared with analysis, which should not be changed afterwards.
+        :param analysis: DocumentAnalysis - merged result of every document of the corpus.
+        """
+        self.vocabulary = analysis.vocabulary
+        self.sentence_index = analysis.sentence_index
+        self.number_of_sentences = analysis.number_of_sentences
+        self.tag_windows = analysis.tag_windows
+        self.counts = analysis.counts.copy()
+        self.follower_counts = _MASK_BIT_COUNTS[analysis.follower_masks]
+        self._ids_by_follower_count = np.argsort(self.follower_counts, kind='stable').astype(np.int32)
+        self._sorted_follower_counts = self.follower_counts[self._ids_by_follower_count]
+        self._stopwords = np.zeros(len(self.vocabulary), dtype=bool)
+        self._stopwords[self.vocabulary.lookup(TokenFilter.stopword_filter())] = True
+        self._freeze()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._freeze()
+
+    def interesting_word_ids(self, number_following):
+        """
+        :param number_following: Int - minimum number of following types.
+        :return: numpy array of ids of words with >= number_following following types, in ascending order.
+            Words without following types are never returned.
+        """
+        start = np.searchsorted(self._sorted_follower_counts, max(number_following, 1), side='left')
+        return np.sort(self._ids_by_follower_count[start:])
+
+    def interesting_words(self, number_following):
+        """
+        :param number_following: Int - minimum number of following types.
+        :return: List of Strings - words with >= number_following following types that are not stopwords,
+            in order of first occurrence.
+        """
+        return self.vocabulary.decode(self._without_stopwords(self.interesting_word_ids(number_following)))
+
+    def most_common_words(self, number_following, most_common_number):
+        """
+        :param number_following: Int - minimum number of following types.
+        :param most_common_number: Int - number of words returned.
+        :return: List of Strings - the most common interesting words ordered alphabetically, ties in count going to
+            the word first alphabetically so the words do not depend on the order documents were merged in.
+        """
+        word_ids = self._without_stopwords(self.interesting_word_ids(number_following))
+        most_common_ids = WordCounter.most_common_word_ids(
+            self.counts, word_ids, most_common_number, self.vocabulary
+        )
+        return sorted(self.vocabulary.decode(most_common_ids))
+
+    def most_ambiguous_words(self, number, distance=1, following=True):
+        """
+        Ranks words by the entropy of the types at a distance from them, a word followed by many types
+        equally often ranking above one mostly followed by a single type.
+        :param number: Int - number of words returned.
+        :param distance: Int - distance from the word, from 1 to the tag window.
+        :param following: Bool - whether the types of following words are ranked, rather than preceding ones.
+        :return: List of tuples of form (word, entropy - Float, number of types - Int) that are not stopwords,
+            by descending entropy, ties going to the word first alphabetically.
+        """
+        if self.tag_windows is None:
+            raise ValueError('the corpus was analysed without a tag window')
+        entropy = self.tag_windows.entropy(distance, following)
+        cardinality = self.tag_windows.cardinality(distance, following)
+        word_ids = self._without_stopwords(np.flatnonzero(cardinality))
+        word_ids = WordCounter.most_common_word_ids(entropy, word_ids, number, self.vocabulary)
+        return list(zip(self.vocabulary.decode(word_ids), entropy[word_ids].tolist(), cardinality[word_ids].tolist()))
+
+    def word_contexts(self, words, max_contexts=None):
+        """
+        :param words: list of Strings corresponding to words tokens.
+        :param max_contexts: Int - maximum number of contexts of each word, None keeps all.
+        :return: generator of tuples of form (word, generator of 'sentence contexts'), see SentenceIndex.
+        """
+        return self.sentence_index.iter_word_contexts(words, max_contexts)
+
+    def _without_stopwords(self, word_ids):
+        """
+        :param word_ids: numpy array of word ids.
+        :return: numpy array - word_ids without the ids of stopwords.
+        """
+        return word_ids[~self._stopwords[word_ids]]
+
+    def _freeze(self):
+        word_arrays = self.counts, self.follower_counts, self._ids_by_follower_count, self._sorted_follower_counts
+        for word_array in (*word_arrays, self._stopwords):
+            word_array.setflags(write=False)
+
+
+def analyse_document(
+    document_path, document_name, chunk_size=None, tagging_backend=None, tag_window=0, deduplicator=None
+):
+    """
+    Reads, tokenizes and tags a single document. Module level so it can run in a worker process.
+    :param document_path: String - path to the document.
+    :param document_name: String - name the document's sentences are recorded under.
+    :param chunk_size: Int - when given the document is streamed chunk_size bytes at a time
+        and its sentences are not added to the sentence index.
+    :param tagging_backend: tagging backend passed on to WordNormalizer.
+    :param tag_window: Int - number of words before and after each word whose types are counted.
+    :param deduplicator: SentenceDeduplicator repeated sentences of the sentence index are found with.
+    :return: DocumentAnalysis - partial result of the document, with the time spent tokenizing, tagging etc.
+        in stage_seconds. The document is memory-mapped so reading it is part of tokenizing.
+    """
+    tokenizer = _word_tokenizer()
+    analysis = DocumentAnalysis(tag_window, deduplicator)
+    index_sentences = chunk_size is None
+    if index_sentences:
+        analysis.sentence_index.add_document(document_name, document_path)
+    last_tagged_word = None
+    chunks = DocumentTextExtractor._iter_document_chunks(document_path, document_name, chunk_size, tokenizer)
+    while True:
+        with _timed(analysis.stage_seconds, 'tokenize'):
+            sentences = next(chunks, None)
+        if sentences is None:
+            break
+        last_tagged_word = analysis.add_sentences(sentences, index_sentences, last_tagged_word, tagging_backend)
+    return analysis
+
+
+class AnalysisCache:
+
+    VERSION = 10
+
+    def __init__(self, cache_path):
+        """
+        On-disk store of per-document DocumentAnalysis partial results.
+        Entries are keyed by document path and checked against the document's size, modification time
+        and content hash. The content is only hashed again when the size and modification time
+        no longer match, so a touched but unchanged document is still a hit.
+        :param cache_path: String - path of the cache file, created on save.
+        """
+        self._cache_path = cache_path
+        self._entries = self._load(cache_path)
+
+    def get(self, document_path, chunk_size, tag_window=0, deduplicator=None, tagging_backend=None):
+        """
+        :param document_path: String representing path to document.
+        :param chunk_size: Int - chunk size the document is analysed with, None when not streamed.
+        :param tag_window: Int - tag window the document is analysed with.
+        :param deduplicator: SentenceDeduplicator the document is analysed with.
+        :param tagging_backend: tagging backend the document is tagged with, None for a pos_tag call per document.
+        :return: DocumentAnalysis of the document, or None when there is no valid cached result.
+        """
+        entry = self._entries.get(document_path)
+        settings = (
+            chunk_size, tag_window, None if deduplicator is None else deduplicator.settings,
+            self._tagging_settings(tagging_backend)
+        )
+        if entry is None or (
+            entry['chunk_size'], entry['tag_window'], entry['deduplicator'], entry['tagging_backend']
+        ) != settings:
+            return None
+        stat = os.stat(document_path)
+        if (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime_ns):
+            return entry['analysis']
+        if entry['size'] == stat.st_size and entry['hash'] == self._content_hash(document_path):
+            entry['mtime'] = stat.st_mtime_ns
+            entry['analysis'].sentence_index.touch_document(document_path)
+            return entry['analysis']
+        return None
+
+    def put(self, document_path, chunk_size, analysis, tag_window=0, deduplicator=None, tagging_backend=None):
+        """
+        :param document_path: String representing path to document.
+        :param chunk_size: Int - chunk size the document was analysed with, None when not streamed.
+        :param analysis: DocumentAnalysis - partial result of the document.
+        :param tag_window: Int - tag window the document was analysed with.
+        :param deduplicator: SentenceDeduplicator the document was analysed with.
+        :param tagging_backend: tagging backend the document was tagged with, None for a pos_tag call per document.
+        """
+        stat = os.stat(document_path)
+        self._entries[document_path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': self._content_hash(document_path),
+            'chunk_size': chunk_size,
+            'tag_window': tag_window,
+            'deduplicator': None if deduplicator is None else deduplicator.settings,
+            'tagging_backend': self._tagging_settings(tagging_backend),
+            'analysis': analysis,
+        }
+
+    def unchanged(self, document_path, size, mtime):
+        """
+        :param document_path: String representing path to document.
+        :param size: Int - size of the document in bytes.
+        :param mtime: Int - modification time of the document in nanoseconds.
+        :return: Bool - whether the document has an entry of the same size and modification time.
+        """
+        entry = self._entries.get(document_path)
+        return entry is not None and (entry['size'], entry['mtime']) == (size, mtime)
+
+    def evict_deleted(self):
+        """
+        Removes entries of documents that no longer exist.
+        """
+        for document_path in [p for p in self._entries if not os.path.isfile(p)]:
+            del self._entries[document_path]
+
+    def save(self):
+        """
+        Writes the cache file, replacing the previous one only once it is complete.
+        """
+        temporary_path = f'{self._cache_path}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump({'version': self.VERSION, 'entries': self._entries}, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self._cache_path)
+
+    def __contains__(self, document_path):
+        return document_path in self._entries
+
+    @staticmethod
+    def _load(cache_path):
+        """
+        :param cache_path: String - path of the cache file.
+        :return: dict of cache entries by document path, empty if there is no cache of the current version.
+        """
+        if not os.path.isfile(cache_path):
+            return {}
+        with open(cache_path, 'rb') as file:
+            cache = pickle.load(file)
+        return cache['entries'] if cache.get('version') == AnalysisCache.VERSION else {}
+
+    @staticmethod
+    def _tagging_settings(tagging_backend):
+        """
+        :param tagging_backend: tagging backend, None for a pos_tag call per document.
+        :return: the backend's settings the tags depend on, or the name of its class when it has none,
+            so a cache must be cleared when a custom backend without settings changes how it tags.
+        """
+        if tagging_backend is None:
+            return None
+        backend_type = type(tagging_backend)
+        return getattr(tagging_backend, 'settings', f'{backend_type.__module__}.{backend_type.__qualname__}')
+
+    @staticmethod
+    def _content_hash(document_path, block_size=1 << 20):
+        """
+        :param document_path: String representing path to document.
+        :param block_size: Int - number of bytes read at a time.
+        :return: String - hex digest of the SHA-256 hash of the document content.
+        """
+        content_hash = hashlib.sha256()
+        with open(document_path, 'rb') as file:
+            for block in iter(lambda: file.read(block_size), b''):
+                content_hash.update(block)
+        return content_hash.hexdigest()
+
+
+class TokenFilter:
+
+    def __init__(self, remove_list):
+        """
+        Precompiled hash set of tokens to remove, built once and shared by every filtering stage.
+        :param remove_list: iterable of String objects - tokens to remove, matched case insensitively.
+        """
+        self._remove_set = frozenset(token.lower() for token in remove_list)
+
+    def __contains__(self, token):
+        return token.lower() in self._remove_set
+
+    def __iter__(self):
+        return iter(self._remove_set)
+
+    def remove(self, tokens, lower_case=False):
+        """
+        :param tokens: iterable of String objects.
+        :param lower_case: Bool - whether tokens are already in lower case, so they are not lowered again.
+        :return: List of String objects corresponding to tokens without the removed tokens.
+        """
+        remove_set = self._remove_set
+        if lower_case:
+            return [token for token in tokens if token not in remove_set]
+        return [token for token in tokens if token.lower() not in remove_set]
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def punctuation_filter():
+        """
+        :return: TokenFilter of punctuation, punctuation has no case so tokens need no lowering.
+        """
+        return TokenFilter(list(punctuation) + ['’', '—'])
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def stopword_filter(language='english'):
+        """
+        :param language: String - language of the nltk stopwords corpus.
+        :return: TokenFilter of the stopwords, loaded once per process.
+        """
+        from nltk.corpus import stopwords
+        return TokenFilter(stopwords.words(language))
+
+
+class PerceptronTaggingBackend:
+    """
+    Tags sentences with the nltk averaged perceptron tagger mapped to the universal tagset.
+    A tagging backend is any object with a tag_sentences method like this one's, tagging each sentence on its own,
+    and optionally a settings property of the settings its tags depend on, results cached by AnalysisCache
+    being kept apart by them.
+    """
+
+    settings = ('perceptron',)
+
+    @staticmethod
+    def tag_sentences(sentences):
+        """
+        :param sentences: List of Lists of Strings - word tokens of each sentence.
+        :return: List of Lists of tuples in form (word, word type), one List for each sentence.
+        """
+        return pos_tag_sents(sentences, tagset='universal')
+
+
+class CachedTaggingBackend:
+
+    def __init__(self, backend=None, max_size=100000, store_path=None):
+        """
+        Memoizes the tags of each sentence by a hash of its tokens, so repeated sentences are tagged once.
+        Tags are kept in a bounded LRU in memory and, when store_path is given, in an sqlite store shared
+        between runs and worker processes. In a pool each document is tagged by its own copy of the backend,
+        so without store_path a sentence is only tagged once within each document.
+        :param backend: tagging backend sentences missing from the cache are tagged with,
+            PerceptronTaggingBackend by default.
+        :param max_size: Int - number of sentences kept in memory.
+        :param store_path: String - path of the sqlite file the tags are also stored in.
+        """
+        self._backend = backend or PerceptronTaggingBackend()
+        self._max_size = max_size
+        self._store_path = store_path
+        self._cache = OrderedDict()
+        self._store = None
+
+    @property
+    def settings(self):
+        """
+        :return: the settings of the backend, tags being the same whether they are cached or not.
+        """
+        return AnalysisCache._tagging_settings(self._backend)
+
+    def tag_sentences(self, sentences):
+        """
+        :param sentences: List of Lists of Strings - word tokens of each sentence.
+        :return: List of Lists of tuples in form (word, word type), one List for each sentence.
+        """
+        keys = [self._key(sentence) for sentence in sentences]
+        sentence_tags = [self._get(key) for key in keys]
+        missing = {key: sentence for key, sentence, tags in zip(keys, sentences, sentence_tags) if tags is None}
+        if missing:
+            tagged_sentences = self._backend.tag_sentences(list(missing.values()))
+            for key, tagged_sentence in zip(missing, tagged_sentences):
+                missing[key] = bytes(TAG_IDS[tag] for word, tag in tagged_sentence)
+                self._put(key, missing[key])
+            if self._store is not None:
+                self._store.commit()
+            sentence_tags = [missing[key] if tags is None else tags for key, tags in zip(keys, sentence_tags)]
+        return [
+            list(zip(sentence, (TAGS[tag_id] for tag_id in tags))) for sentence, tags in zip(sentences, sentence_tags)
+        ]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_store'] = None
+        return state
+
+    @staticmethod
+    def _key(sentence):
+        """
+        :param sentence: List of Strings - word tokens of a sentence.
+        :return: bytes - hash of the tokens.
+        """
+        return hashlib.blake2b('\x00'.join(sentence).encode(), digest_size=16).digest()
+
+    def _get(self, key):
+        """
+        :param key: bytes - hash of a sentence.
+        :return: bytes of the sentence's tag ids in TAGS, None when not cached.
+        """
+        tags = self._cache.get(key)
+        if tags is not None:
+            self._cache.move_to_end(key)
+            return tags
+        store = self._open_store()
+        if store is not None:
+            row = store.execute('SELECT tags FROM sentence_tags WHERE sentence = ?', (key,)).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                return row[0]
+        return None
+
+    def _put(self, key, tags):
+        """
+        :param key: bytes - hash of a sentence.
+        :param tags: bytes of the sentence's tag ids in TAGS.
+        """
+        self._remember(key, tags)
+        store = self._open_store()
+        if store is not None:
+            store.execute('INSERT OR REPLACE INTO sentence_tags VALUES (?, ?)', (key, tags))
+
+    def _remember(self, key, tags):
+        """
+        Adds tags to the in memory LRU, evicting the least recently used sentence when full.
+        """
+        self._cache[key] = tags
+        if len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+    def _open_store(self):
+        """
+        :return: sqlite3 Connection to the store, None when there is no store_path.
+        """
+        if self._store is None and self._store_path is not None:
+            self._store = sqlite3.connect(self._store_path, timeout=60)
+            self._store.execute('CREATE TABLE IF NOT EXISTS sentence_tags (sentence BLOB PRIMARY KEY, tags BLOB)')
+        return self._store
+
+
+class LexiconTaggingBackend:
+
+    def __init__(self, backend=None, lexicon=None):
+        """
+        Tags sentences whose words all have a single type in the lexicon without the backend,
+        other sentences are tagged by the backend so ambiguous words are tagged in context.
+        :param backend: tagging backend for sentences with ambiguous words, PerceptronTaggingBackend by default.
+        :param lexicon: dict of form {word - String: word type - String}, by default the words the perceptron
+            tagger itself tags without context, which keeps the result identical to the perceptron's.
+        """
+        self._backend = backend or PerceptronTaggingBackend()
+        self._lexicon = lexicon
+        self._lexicon_hash = None if lexicon is None else hashlib.blake2b(
+            repr(sorted(lexicon.items())).encode(), digest_size=16
+        ).hexdigest()
+
+    @property
+    def settings(self):
+        """
+        :return: tuple of the settings the tags depend on - a hash of the lexicon, None for the default one,
+            and the backend's settings.
+        """
+        return 'lexicon', self._lexicon_hash, AnalysisCache._tagging_settings(self._backend)
+
+    @property
+    def lexicon(self):
+        if self._lexicon is None:
+            self._lexicon = self.perceptron_lexicon()
+        return self._lexicon
+
+    def tag_sentences(self, sentences):
+        """
+        :param sentences: List of Lists of Strings - word tokens of each sentence.
+        :return: List of Lists of tuples in form (word, word type), one List for each sentence.
+        """
+        lexicon = self.lexicon
+        tagged_sentences = [
+            [(word, lexicon[word]) for word in sentence] if all(word in lexicon for word in sentence) else None
+            for sentence in sentences
+        ]
+        ambiguous = [i for i, tagged_sentence in enumerate(tagged_sentences) if tagged_sentence is None]
+        if ambiguous:
+            for i, tagged_sentence in zip(ambiguous, self._backend.tag_sentences([sentences[i] for i in ambiguous])):
+                tagged_sentences[i] = tagged_sentence
+        return tagged_sentences
+
+    @staticmethod
+    def perceptron_lexicon():
+        """
+        :return: dict of form {word - String: word type - String} of the perceptron tagger's tag dictionary
+            mapped to the universal tagset.
+        """
+        from nltk.tag import map_tag
+        return {word: map_tag('en-ptb', 'universal', tag) for word, tag in _tagger().tagdict.items()}
+
+
+class WordNormalizer:
+
+    def __init__(self, tagging_backend=None):
+        """
+        :param tagging_backend: tagging backend used by tag_sentences, such as CachedTaggingBackend.
+        """
+        self.tagging_backend = tagging_backend
+
+    @staticmethod
+    def remove_from_tokens(tokens, remove_list):
+        """
+        :param tokens: List of String objects.
+        :param remove_list: TokenFilter or List of String objects - tokens to remove - should be in lower case.
+        :return: List of String objects corresponding to tokens without words from remove_list.
+        """
+        remove_filter = remove_list if isinstance(remove_list, TokenFilter) else TokenFilter(remove_list)
+        return remove_filter.remove(tokens)
+
+    @staticmethod
+    def word_tagger(tokens):
+        """
+        :param tokens: List Strings corresponding to word tokens
+        :return: List of tuples in form (word, word type)
+        """
+        return pos_tag(tokens, tagset='universal')
+
+    def normalize_words(self, word_tokens):
+        """
+        - removes punctuation from words
+        - tags words with word types
+        - creates bigram of in form tuples (word, word_type)
+        :param word_tokens: List Strings representing words
+        :return: list bigrams of (word, word_type) e.g. [((hammer, NOUN), (hard, ADJECTIVE))]
+        """
+        from nltk import bigrams
+        return bigrams(self.tag_words(word_tokens))
+
+    def tag_words(self, word_tokens):
+        """
+        - removes punctuation from words
+        - tags words with word types
+        :param word_tokens: List Strings representing words
+        :return: List of tuples in form (word, word type)
+        """
+        no_punct_tokens = TokenFilter.punctuation_filter().remove(word_tokens, lower_case=True)
+        return self.word_tagger(no_punct_tokens)
+
+    def tag_sentences(self, sentences_words):
+        """
+        - removes punctuation from words
+        - tags words with word types, each sentence on its own with the tagging backend,
+          or all words in one call when there is no backend
+        :param sentences_words: List of Lists of Strings representing the words of consecutive sentences
+        :return: List of tuples in form (word, word type) of all sentences
+        """
+        if self.tagging_backend is None:
+            return self.tag_words([word for words in sentences_words for word in words])
+        punctuation_filter = TokenFilter.punctuation_filter()
+        tagged_sentences = self.tagging_backend.tag_sentences(
+            [punctuation_filter.remove(words, lower_case=True) for words in sentences_words]
+        )
+        return [tagged_word for tagged_sentence in tagged_sentences for tagged_word in tagged_sentence]
+
+
+class WordCounter:
+
+    @staticmethod
+    def most_common_words(all_tokens, interesting_words, number, counter=None):
+        """
+        Counts the interesting words while the tokens stream past and selects the most common with a bounded heap.
+        DocumentTextExtractor counts over its vocabulary instead, see DocumentAnalysis and most_common_word_ids.
+        :param all_tokens: iterable of String objects representing all tokens.
+        :param interesting_words: list of String objects representing words to be counted.
+        :param number: int number of most common words to be returned.
+        :param counter: counter the words are counted in, such as SpaceSavingCounter or CountMinSketchCounter
+            for an approximate count in bounded memory, ExactCounter by default.
+            It may already hold counts of other shards.
+        :return: list - most common words ordered alphabetically.
+        """
+        counter = ExactCounter() if counter is None else counter
+        interesting_set = frozenset(interesting_words)
+        counter.update(token for token in all_tokens if token in interesting_set)
+        return sorted(word for word, count in counter.most_common(number))
+
+    @staticmethod
+    def most_common_word_ids(counts, word_ids, number, vocabulary=None):
+        """
+        :param counts: numpy array of token counts indexed by word id.
+        :param word_ids: numpy array of ids of the words to be counted.
+        :param number: int number of most common word ids to be returned.
+        :param vocabulary: Vocabulary of the words - when given ties go to the word first in alphabetical order,
+            which unlike the order words were seen in does not depend on the order partials were merged in.
+        :return: numpy array - ids of the most common words, ties going to the word seen first.
+            The words are selected with argpartition on a key unique to each word, so only they are sorted.
+        """
+        word_ids = np.unique(word_ids)
+        if vocabulary is not None:
+            return WordCounter._most_common_word_ids_by_word(counts, word_ids, number, vocabulary)
+        if 0 < number < len(word_ids):
+            keys = counts[word_ids].astype(np.int64) * len(counts) - word_ids
+            word_ids = word_ids[np.argpartition(-keys, number - 1)[:number]]
+        return word_ids[np.lexsort((word_ids, -counts[word_ids]))][:number]
+
+    @staticmethod
+    def _most_common_word_ids_by_word(counts, word_ids, number, vocabulary):
+        """
+        most_common_word_ids with ties going to the word first in alphabetical order, only the words with
+        at least the count of the number-th most common word being decoded and sorted.
+        :param counts: numpy array of scores indexed by word id, such as token counts.
+        :param word_ids: numpy array of unique ids of the words to be counted.
+        :param number: int number of most common word ids to be returned.
+        :param vocabulary: Vocabulary of the words.
+        :return: numpy array - ids of the most common words.
+        """
+        if number <= 0:
+            return word_ids[:0]
+        word_counts = counts[word_ids]
+        if number < len(word_ids):
+            threshold = np.partition(word_counts, len(word_ids) - number)[len(word_ids) - number]
+            word_ids, word_counts = word_ids[word_counts >= threshold], word_counts[word_counts >= threshold]
+        words = vocabulary.decode(word_ids)
+        order = sorted(range(len(word_ids)), key=lambda i: (-word_counts[i], words[i]))
+        return word_ids[order[:number]]
+
+    @staticmethod
+    def top(items, number):
+        """
+        :param items: iterable of tuples of form (word, count) in order of first occurrence.
+        :param number: int number of items returned.
+        :return: List of tuples of form (word, count) with the highest counts, ties going to the word seen first.
+        """
+        return heapq.nlargest(number, items, key=itemgetter(1))
+
+
+class ExactCounter:
+
+    def __init__(self, counts=None):
+        """
+        Exact counts of a token stream, mergeable with the counts of other shards.
+        :param counts: dict of form {word - String: count - Int} to start from.
+        """
+        self._counts = Counter(counts or {})
+
+    def __getitem__(self, word):
+        return self._counts[word]
+
+    def __len__(self):
+        return len(self._counts)
+
+    def update(self, tokens):
+        """
+        :param tokens: iterable of Strings, each counted once.
+        """
+        self._counts.update(tokens)
+
+    def merge(self, other):
+        """
+        :param other: ExactCounter of another shard.
+        :return: ExactCounter - self.
+        """
+        self._counts.update(other._counts)
+        return self
+
+    def most_common(self, number):
+        """
+        :param number: Int - number of words returned.
+        :return: List of tuples of form (word, count), ties going to the word seen first.
+        """
+        return WordCounter.top(self._counts.items(), number)
+
+
+class SpaceSavingCounter:
+
+    def __init__(self, error=0.001, capacity=None):
+        """
+        Space-Saving counter, keeping at most capacity words however many distinct words the stream has.
+        A word's count is never below its true count and at most total / capacity above it,
+        so any word more frequent than total / capacity is counted.
+        :param error: Float - maximum overestimate of a count as a fraction of the number of tokens counted.
+        :param capacity: Int - number of words kept, ceil(1 / error) by default.
+        """
+        self.capacity = capacity or math.ceil(1 / error)
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+
+    def __getitem__(self, word):
+        return self._counts.get(word, self._minimum() if len(self._counts) == self.capacity else 0)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def error(self, word):
+        """
+        :param word: String.
+        :return: Int - how much the count of word may be above its true count.
+        """
+        return self._errors.get(word, self[word])
+
+    def update(self, tokens, batch_size=100000):
+        """
+        :param tokens: iterable of Strings, counted batch_size at a time.
+        :param batch_size: Int - number of tokens tallied before words are evicted.
+        """
+        tokens = iter(tokens)
+        for batch in iter(lambda: Counter(islice(tokens, batch_size)), Counter()):
+            self._add(batch.items())
+
+    def merge(self, other):
+        """
+        Adds the counts of another shard, keeping the capacity words with the highest counts.
+        A word missing from a full counter is given its minimum count, as its count there may be up to that.
+        :param other: SpaceSavingCounter of another shard.
+        :return: SpaceSavingCounter - self.
+        """
+        minimums = [c._minimum() if len(c._counts) == c.capacity else 0 for c in (self, other)]
+        counts, errors = {}, {}
+        for word in dict.fromkeys([*self._counts, *other._counts]):
+            counts[word], errors[word] = 0, 0
+            for counter, minimum in zip((self, other), minimums):
+                counts[word] += counter._counts.get(word, minimum)
+                errors[word] += counter._errors.get(word, minimum)
+        kept = WordCounter.top(counts.items(), self.capacity)
+        self._counts = dict(kept)
+        self._errors = {word: errors[word] for word, count in kept}
+        self.total += other.total
+        return self
+
+    def most_common(self, number):
+        """
+        :param number: Int - number of words returned.
+        :return: List of tuples of form (word, count), counts overestimated by at most total / capacity.
+        """
+        return WordCounter.top(self._counts.items(), number)
+
+    def _add(self, word_counts):
+        """
+        :param word_counts: iterable of tuples of form (word, count) to add.
+        """
+        counts, errors = self._counts, self._errors
+        new_words = []
+        for word, count in word_counts:
+            self.total += count
+            if word in counts:
+                counts[word] += count
+            elif len(counts) < self.capacity:
+                counts[word], errors[word] = count, 0
+            else:
+                new_words.append((word, count))
+        if not new_words:
+            return
+        heap = [(count, word) for word, count in counts.items()]
+        heapq.heapify(heap)
+        for word, count in new_words:
+            minimum, evicted = heap[0]
+            del counts[evicted], errors[evicted]
+            counts[word], errors[word] = minimum + count, minimum
+            heapq.heapreplace(heap, (minimum + count, word))
+
+    def _minimum(self):
+        return min(self._counts.values(), default=0)
+
+
+class CountMinSketchCounter:
+
+    def __init__(self, epsilon=0.0001, delta=0.01, candidates=1000, seed=0):
+        """
+        Count-Min Sketch of a token stream, in memory independent of the number of distinct words,
+        with the candidates words of highest estimated count kept to answer most_common.
+        A count is never below the true count and, with probability 1 - delta, at most epsilon * total above it.
+        Counters merge only with counters of the same epsilon, delta and seed.
+        :param epsilon: Float - maximum overestimate of a count as a fraction of the number of tokens counted.
+        :param delta: Float - probability of a count being overestimated by more than that.
+        :param candidates: Int - number of words kept for most_common, at least the number asked for.
+        :param seed: Int - seed of the hash functions.
+        """
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.total = 0
+        self._candidates = candidates
+        self._seed = seed
+        self._table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self._top = {}
+
+    def __getitem__(self, word):
+        return int(self._estimate(self._columns([word]))[0])
+
+    def update(self, tokens, batch_size=100000):
+        """
+        :param tokens: iterable of Strings, counted batch_size at a time.
+        :param batch_size: Int - number of tokens tallied before the sketch is updated.
+        """
+        tokens = iter(tokens)
+        for batch in iter(lambda: Counter(islice(tokens, batch_size)), Counter()):
+            words = list(batch)
+            columns = self._columns(words)
+            rows = np.arange(self.depth)[:, None]
+            np.add.at(self._table, (rows, columns.astype(np.int64)), np.fromiter(batch.values(), np.int64))
+            self.total += sum(batch.values())
+            self._keep_candidates(words, columns)
+
+    def merge(self, other):
+        """
+        :param other: CountMinSketchCounter of another shard, with the same epsilon, delta and seed.
+        :return: CountMinSketchCounter - self.
+        """
+        if (self.width, self.depth, self._seed) != (other.width, other.depth, other._seed):
+            raise ValueError('other: can only merge sketches of the same epsilon, delta and seed')
+        self._table += other._table
+        self.total += other.total
+        words = list(dict.fromkeys([*self._top, *other._top]))
+        self._top = {}
+        self._keep_candidates(words, self._columns(words))
+        return self
+
+    def most_common(self, number):
+        """
+        :param number: Int - number of words returned, at most the number of candidates.
+        :return: List of tuples of form (word, estimated count).
+        """
+        return WordCounter.top(self._top.items(), number)
+
+    def _columns(self, words):
+        """
+        :param words: List of Strings.
+        :return: numpy array of shape (depth, len(words)) - column of each word in each row of the table,
+            from two halves of a stable hash so sketches of different processes merge.
+        """
+        salt = self._seed.to_bytes(8, 'little')
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8, salt=salt).digest(), 'little')
+             for word in words],
+            dtype=np.uint64
+        ).reshape(1, -1)
+        rows = np.arange(self.depth, dtype=np.uint64).reshape(-1, 1)
+        return ((hashes & np.uint64(0xFFFFFFFF)) + rows * (hashes >> np.uint64(32))) % np.uint64(self.width)
+
+    def _estimate(self, columns):
+        return self._table[np.arange(self.depth)[:, None], columns.astype(np.int64)].min(axis=0)
+
+    def _keep_candidates(self, words, columns):
+        """
+        Re-estimates the candidates and words, keeping the candidates words of highest estimate.
+        """
+        candidates = list(self._top)
+        estimates = dict(zip(candidates, self._estimate(self._columns(candidates)).tolist())) if candidates else {}
+        estimates.update(zip(words, self._estimate(columns).tolist()))
+        self._top = dict(WordCounter.top(estimates.items(), self._candidates))
+
+
+class PipelineMetrics:
+
+    def __init__(self, sinks=(), profile=(), trace_allocations=()):
+        """
+        Times and counts the stages of a DocumentTextExtractor run.
+        - stages: dict of form {stage: {'seconds': Float, 'calls': Int}} of the stages run in this process.
+        - document_stages: dict of form {stage: seconds} of reading, tokenizing, tagging etc. summed over
+            documents, which may exceed the elapsed time when documents are analysed by several workers.
+        - counters: dict of form {'documents': Int, 'bytes': Int, 'sentences': Int, 'tokens': Int, ...}.
+        - profiles: dict of form {stage: cProfile.Profile} of the profiled stages.
+        - allocation_snapshots: dict of form {stage: tracemalloc.Snapshot} taken at the end of traced stages.
+        :param sinks: iterable of callables each sent the report on emit, such as JsonLinesMetricsSink,
+            PrometheusMetricsSink or any function taking a dict.
+        :param profile: iterable of Strings - names of stages run under cProfile.
+        :param trace_allocations: iterable of Strings - names of stages whose peak memory is traced with tracemalloc.
+        """
+        self.sinks = list(sinks)
+        self._profile = frozenset(profile)
+        self._trace_allocations = frozenset(trace_allocations)
+        self.stages = {}
+        self.document_stages = defaultdict(float)
+        self.counters = {}
+        self.profiles = {}
+        self.allocation_snapshots = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager timing the stage run in its body, profiling it or tracing its allocations if asked to.
+        :param name: String - name of the stage.
+        """
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+        profiler = self.profiles.setdefault(name, cProfile.Profile()) if name in self._profile else None
+        traced = name in self._trace_allocations
+        started_tracing = traced and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif traced:
+            tracemalloc.reset_peak()
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage['seconds'] += time.perf_counter() - start
+            stage['calls'] += 1
+            if profiler is not None:
+                profiler.disable()
+            if traced:
+                stage['peak_traced_bytes'] = max(stage.get('peak_traced_bytes', 0), tracemalloc.get_traced_memory()[1])
+                self.allocation_snapshots[name] = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+
+    def add_document_stage_seconds(self, stage_seconds):
+        """
+        :param stage_seconds: dict of form {stage - String: seconds - Float} of analysing a document.
+        """
+        for name, seconds in stage_seconds.items():
+            self.document_stages[name] += seconds
+
+    def report(self):
+        """
+        :return: dict of form {'stages': {...}, 'document_stages': {...}, 'counters': {...}, 'seconds': Float,
+            'tokens_per_second': Float, 'bytes_per_second': Float} where the rates are over the time of all stages.
+        """
+        seconds = sum(stage['seconds'] for stage in self.stages.values())
+        return {
+            'stages': {name: dict(stage) for name, stage in self.stages.items()},
+            'document_stages': dict(self.document_stages),
+            'counters': dict(self.counters),
+            'seconds': seconds,
+            'tokens_per_second': self.counters.get('tokens', 0) / seconds if seconds else 0.0,
+            'bytes_per_second': self.counters.get('bytes', 0) / seconds if seconds else 0.0,
+        }
+
+    def emit(self):
+        """
+        Sends the report to every sink.
+        :return: dict - the report.
+        """
+        report = self.report()
+        for sink in self.sinks:
+            sink(report)
+        return report
+
+
+class JsonLinesMetricsSink:
+
+    def __init__(self, path):
+        """
+        Metrics sink appending each report to a JSON-lines log, with the time it was emitted.
+        :param path: String - path of the log file.
+        """
+        self.path = path
+
+    def __call__(self, report):
+        with open(self.path, 'a') as file:
+            file.write(json.dumps({'time': time.time(), **report}) + '\n')
+
+
+class PrometheusMetricsSink:
+
+    def __init__(self, path, prefix='interesting_words'):
+        """
+        Metrics sink writing the last report as gauges in the Prometheus text format,
+        for the node exporter textfile collector. The file is replaced only once it is complete.
+        :param path: String - path of the .prom file.
+        :param prefix: String - prefix of the metric names.
+        """
+        self.path = path
+        self.prefix = prefix
+
+    def __call__(self, report):
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write(self.format(report))
+        os.replace(temporary_path, self.path)
+
+    def format(self, report):
+        """
+        :param report: dict - report of PipelineMetrics.
+        :return: String - the report in the Prometheus text format.
+        """
+        lines = []
+
+        def gauge(name, samples):
+            lines.append(f'# TYPE {self.prefix}_{name} gauge')
+            lines.extend(f'{self.prefix}_{name}{labels} {value}' for labels, value in samples)
+
+        stage_seconds = {stage: stats['seconds'] for stage, stats in report['stages'].items()}
+        for name, stages in [('stage_seconds', stage_seconds), ('document_stage_seconds', report['document_stages'])]:
+            gauge(name, [(f'{{stage="{self._escape(stage)}"}}', seconds) for stage, seconds in stages.items()])
+        for name, value in report['counters'].items():
+            gauge(name, [('', value)])
+        for name in ('seconds', 'tokens_per_second', 'bytes_per_second'):
+            gauge(name, [('', report[name])])
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _escape(label_value):
+        return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,229 @@
+"""
+Long-running service answering interesting words queries over a corpus analysed once.
+python service.py documents --port 8080
+python service.py documents --unix-socket /tmp/interesting_words.sock
+
+GET  /interesting-words?number_following=6&most_common_number=10&contexts=1&max_contexts=5
+GET  /status
+POST /refresh
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from itertools import islice
+from urllib.parse import parse_qs, urlsplit
+
+from interesting_words import DocumentTextExtractor
+
+
+def build_analysis(directory_name, workers=1, chunk_size=None, cache_path=None, tagging_backend=None):
+    """
+    Analyses every document in the directory. Module level so it can run in an executor process.
+    :param directory_name: String - name of directory where files to be read are.
+    :param workers: Int - number of processes the documents are analysed in.
+    :param chunk_size: Int - when given documents are streamed in chunks of about chunk_size bytes.
+    :param cache_path: String - path of a file where per-document results are kept between runs.
+    :param tagging_backend: tagging backend each sentence is tagged with.
+    :return: CorpusAnalysis of the directory.
+    """
+    return DocumentTextExtractor(
+        directory_name, 0, 0, workers=workers, chunk_size=chunk_size, cache_path=cache_path,
+        tagging_backend=tagging_backend
+    ).analysis
+
+
+class InterestingWordsService:
+
+    def __init__(
+        self, directory_name, workers=1, chunk_size=None, cache_path=None, tagging_backend=None, executor=None
+    ):
+        """
+        Keeps the analysis of a corpus in memory and answers queries for any number_following and
+        most_common_number from it. The corpus is analysed in executor, a single worker process by default,
+        so queries are still answered from the previous analysis while a refresh runs.
+        Queries run in the event loop's default thread pool so several are answered at once.
+        :param directory_name: String - name of directory where files to be read are.
+        :param workers: Int - number of processes the documents are analysed in, see DocumentTextExtractor.
+        :param chunk_size: Int - when given documents are streamed and contexts found by reading them again.
+        :param cache_path: String - path of a file where per-document results are kept between refreshes.
+        :param tagging_backend: tagging backend each sentence is tagged with, it must be picklable.
+        :param executor: concurrent.futures Executor the corpus is analysed in, by default a process pool
+            of one worker shut down by close.
+        """
+        self._directory_name = directory_name
+        self._build_arguments = directory_name, workers, chunk_size, cache_path, tagging_backend
+        self._chunk_size = chunk_size
+        self._owns_executor = executor is None
+        self._executor = ProcessPoolExecutor(max_workers=1) if executor is None else executor
+        self._analysis = None
+        self._refresh_task = None
+        self.loaded_at = None
+
+    @property
+    def refreshing(self):
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    def refresh(self):
+        """
+        Starts analysing the corpus again unless it already is, the new analysis replaces the previous one
+        once complete.
+        :return: asyncio Task of the refresh, its result being the CorpusAnalysis.
+        """
+        if not self.refreshing:
+            self._refresh_task = asyncio.ensure_future(self._rebuild())
+        return self._refresh_task
+
+    async def interesting_words(self, number_following, most_common_number, contexts=False, max_contexts=None):
+        """
+        :param number_following: Int - minimum number required of following word kinds.
+        :param most_common_number: Int - number of words returned.
+        :param contexts: Bool - whether the sentence contexts of the words are returned too.
+        :param max_contexts: Int - maximum number of contexts of each word, None returns all.
+        :return: dict of form {'words': [words], 'contexts': {word: ['sentence contexts']}},
+            the contexts only when asked for. Contexts are read by byte offset from the documents analysed,
+            so when one of them was deleted or changed since, the corpus is analysed again first.
+        """
+        if self._analysis is None:
+            await self.refresh()
+        loop = asyncio.get_running_loop()
+        if contexts and self._chunk_size is None:
+            if await loop.run_in_executor(None, self._analysis.sentence_index.changed_documents):
+                await self.refresh()
+        query = partial(self._query, self._analysis, number_following, most_common_number, contexts, max_contexts)
+        return await loop.run_in_executor(None, query)
+
+    def status(self):
+        """
+        :return: dict of form {'loaded': Bool, 'refreshing': Bool, 'loaded_at': Float, 'sentences': Int, ...}.
+        """
+        status = {'loaded': self._analysis is not None, 'refreshing': self.refreshing, 'loaded_at': self.loaded_at}
+        if self._analysis is not None:
+            status.update(
+                sentences=self._analysis.number_of_sentences,
+                tokens=int(self._analysis.counts.sum()),
+                unique_words=len(self._analysis.vocabulary),
+            )
+        return status
+
+    def close(self):
+        """
+        Shuts the executor down when the service created it.
+        """
+        if self._owns_executor:
+            self._executor.shutdown()
+
+    async def serve(self, host='127.0.0.1', port=8080, unix_socket=None):
+        """
+        Analyses the corpus then serves the HTTP API on host and port, or on unix_socket when given.
+        :return: asyncio Server, already serving.
+        """
+        await self.refresh()
+        if unix_socket is not None:
+            return await asyncio.start_unix_server(self._handle, unix_socket)
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _rebuild(self):
+        loop = asyncio.get_running_loop()
+        self._analysis = await loop.run_in_executor(self._executor, build_analysis, *self._build_arguments)
+        self.loaded_at = time.time()
+        return self._analysis
+
+    def _query(self, analysis, number_following, most_common_number, contexts, max_contexts):
+        """
+        :param analysis: CorpusAnalysis the query is answered from.
+        :return: dict - the result of interesting_words.
+        """
+        result = {'words': analysis.most_common_words(number_following, most_common_number)}
+        if contexts:
+            if self._chunk_size is None:
+                word_contexts = analysis.word_contexts(result['words'], max_contexts)
+            else:
+                extractor = DocumentTextExtractor(self._directory_name, 0, 0, chunk_size=self._chunk_size)
+                word_contexts = extractor.get_word_contexts(result['words']).items()
+            result['contexts'] = {word: list(islice(sentences, max_contexts)) for word, sentences in word_contexts}
+        return result
+
+    async def _handle(self, reader, writer):
+        """
+        Answers a single HTTP/1.1 request on the connection, then closes it.
+        Malformed requests and parameters are answered with 400, any other error with 500.
+        """
+        try:
+            request_line = (await reader.readline()).decode('latin-1')
+            while (await reader.readline()).strip():
+                pass
+            method, target, _ = request_line.split(' ', 2)
+            status, body = await self._route(method, target)
+        except Exception as error:
+            if isinstance(error, ValueError) and not isinstance(error, UnicodeError):
+                status, body = HTTPStatus.BAD_REQUEST, {'error': str(error)}
+            else:
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{type(error).__name__}: {error}'}
+        payload = json.dumps(body).encode()
+        writer.write(
+            f'HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _route(self, method, target):
+        """
+        :param method: String - HTTP method of the request.
+        :param target: String - path and query string of the request.
+        :return: tuple of form (HTTPStatus, body - JSON serialisable).
+        """
+        url = urlsplit(target)
+        parameters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if (method, url.path) == ('GET', '/interesting-words'):
+            if self._analysis is None:
+                return HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'the corpus is not analysed yet'}
+            max_contexts = parameters.get('max_contexts')
+            result = await self.interesting_words(
+                int(parameters.get('number_following', 4)),
+                int(parameters.get('most_common_number', 10)),
+                parameters.get('contexts', '0').lower() in ('1', 'true', 'yes'),
+                None if max_contexts is None else int(max_contexts),
+            )
+            return HTTPStatus.OK, result
+        if (method, url.path) == ('GET', '/status'):
+            return HTTPStatus.OK, self.status()
+        if (method, url.path) == ('POST', '/refresh'):
+            self.refresh()
+            return HTTPStatus.ACCEPTED, self.status()
+        return HTTPStatus.NOT_FOUND, {'error': f'no route for {method} {url.path}'}
+
+
+async def _serve_forever(service, host, port, unix_socket):
+    server = await service.serve(host, port, unix_socket)
+    print(f'serving {service.status()["sentences"]:,} sentences on {unix_socket or f"http://{host}:{port}"}')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help='directory of the documents')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', help='path of a Unix socket served instead of host and port')
+    parser.add_argument('--workers', type=int, default=1, help='processes the documents are analysed in')
+    parser.add_argument('--chunk-size', type=int, help='stream documents in chunks of this many bytes')
+    parser.add_argument('--cache-path', help='file where per-document results are kept between refreshes')
+    args = parser.parse_args()
+
+    service = InterestingWordsService(args.directory, args.workers, args.chunk_size, args.cache_path)
+    try:
+        asyncio.run(_serve_forever(service, args.host, args.port, args.unix_socket))
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Sharded processing of a corpus: each node analyses the documents of its shard into a partial result file,
+then the partials of any number of shards are merged into the interesting words table.
+python shards.py analyse documents --shard 0 --shards 4 --output partials/shard-0.pickle
+python shards.py merge partials/*.pickle --number-following 6 --most-common 10 --output interesting_words.csv
+python shards.py local documents --shards 4 --partials partials --output interesting_words.csv
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from interesting_words import DocumentScanner, DocumentTextExtractor, SentenceDeduplicator
+
+
+def analyse_shard(
+    directory_name, shard, number_of_shards, partial_path, workers=1, chunk_size=None, cache_path=None, tag_window=0,
+    include=None, exclude=(), deduplicator=None
+):
+    """
+    :param directory_name: String - name of directory where files to be read are.
+    :param shard: Int - index of the shard, from 0 to number_of_shards - 1.
+    :param number_of_shards: Int - number of shards the directory is split into.
+    :param partial_path: String - path the partial result is written to.
+    :param workers: Int - number of processes the shard's documents are analysed in.
+    :param chunk_size: Int - when given documents are streamed in chunks of about chunk_size bytes.
+    :param cache_path: String - path of a file where per-document results are kept between runs.
+    :param tag_window: Int - number of words before and after each word whose types are counted.
+    :param include: iterable of glob patterns of the documents read, None reads every document.
+    :param exclude: iterable of glob patterns of documents and directories not read.
+    :param deduplicator: SentenceDeduplicator - when given repeated sentences are listed once in contexts,
+        also across the shards merged. Near duplicates are found again on merge, as a single run over the
+        documents of the shards in shard order would find them.
+    """
+    extractor = DocumentTextExtractor(
+        directory_name, 0, 0, workers=workers, chunk_size=chunk_size, cache_path=cache_path,
+        shard=(shard, number_of_shards), tag_window=tag_window, scanner=DocumentScanner(include, exclude),
+        deduplicator=deduplicator
+    )
+    extractor.save_partial(partial_path)
+
+
+def merge_partials(partial_paths, number_following, most_common_number, output, max_contexts=None):
+    """
+    :param partial_paths: iterable of Strings - paths of partial result files.
+    :param number_following: Int - minimum number required of following word kinds.
+    :param most_common_number: Int - number of words exported.
+    :param output: String - path the contexts are exported to, in the format of its extension.
+    :param max_contexts: Int - maximum number of sentence contexts written for each word.
+    :return: Int - number of context rows written.
+    """
+    extractor = DocumentTextExtractor.from_partials(partial_paths, number_following, most_common_number)
+    return extractor.export_interesting_words(output, max_contexts=max_contexts)
+
+
+def run_local(directory_name, number_of_shards, partials_directory, number_following, most_common_number, output,
+              max_contexts=None):
+    """
+    Analyses every shard in its own process, standing in for a node each, then merges the partials.
+    :param directory_name: String - name of directory where files to be read are.
+    :param number_of_shards: Int - number of shards the directory is split into.
+    :param partials_directory: String - directory the partial result files are written to.
+    The other parameters are those of merge_partials.
+    :return: Int - number of context rows written.
+    """
+    os.makedirs(partials_directory, exist_ok=True)
+    partial_paths = [os.path.join(partials_directory, f'shard-{shard}.pickle') for shard in range(number_of_shards)]
+    processes = [
+        subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), 'analyse', directory_name,
+            '--shard', str(shard), '--shards', str(number_of_shards), '--output', partial_path
+        ])
+        for shard, partial_path in enumerate(partial_paths)
+    ]
+    failed = [shard for shard, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f'shards {failed} failed')
+    return merge_partials(partial_paths, number_following, most_common_number, output, max_contexts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyse_parser = subparsers.add_parser('analyse', help='analyse the documents of a shard into a partial result')
+    analyse_parser.add_argument('directory')
+    analyse_parser.add_argument('--shard', type=int, required=True)
+    analyse_parser.add_argument('--shards', type=int, required=True, help='number of shards')
+    analyse_parser.add_argument('--output', required=True, help='partial result file')
+    analyse_parser.add_argument('--workers', type=int, default=1)
+    analyse_parser.add_argument('--chunk-size', type=int)
+    analyse_parser.add_argument('--cache-path')
+    analyse_parser.add_argument('--tag-window', type=int, default=0, help='count types this many words around')
+    analyse_parser.add_argument('--include', action='append', help='glob of the documents read, e.g. "*.txt"')
+    analyse_parser.add_argument('--exclude', action='append', default=[], help='glob of documents not read')
+    analyse_parser.add_argument('--deduplicate', action='store_true', help='list repeated sentences once')
+    analyse_parser.add_argument('--near-duplicates', action='store_true', help='also sentences with similar words')
+
+    merge_parser = subparsers.add_parser('merge', help='merge partial results into the interesting words table')
+    merge_parser.add_argument('partials', nargs='+')
+
+    local_parser = subparsers.add_parser('local', help='analyse every shard in its own process, then merge')
+    local_parser.add_argument('directory')
+    local_parser.add_argument('--shards', type=int, required=True, help='number of shards')
+    local_parser.add_argument('--partials', required=True, help='directory of the partial result files')
+
+    for subparser in (merge_parser, local_parser):
+        subparser.add_argument('--number-following', type=int, default=4)
+        subparser.add_argument('--most-common', type=int, default=10)
+        subparser.add_argument('--output', default='interesting_words.csv')
+        subparser.add_argument('--max-contexts', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'analyse':
+        deduplicator = None
+        if args.deduplicate or args.near_duplicates:
+            deduplicator = SentenceDeduplicator(near_duplicates=args.near_duplicates)
+        analyse_shard(args.directory, args.shard, args.shards, args.output, args.workers, args.chunk_size,
+                      args.cache_path, args.tag_window, args.include, args.exclude, deduplicator)
+    elif args.command == 'merge':
+        rows = merge_partials(args.partials, args.number_following, args.most_common, args.output, args.max_contexts)
+        print(f'wrote {rows} rows to {args.output}')
+    elif args.command == 'local':
+        rows = run_local(args.directory, args.shards, args.partials, args.number_following, args.most_common,
+                         args.output, args.max_contexts)
+        print(f'wrote {rows} rows to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
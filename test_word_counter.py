@@ -1,9 +1,35 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import pickle
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from string import punctuation
-from unittest import main, TestCase
+from unittest import main, mock, skipUnless, TestCase
 
+import numpy as np
 from nltk import TweetTokenizer
 
-from interesting_words import WordCounter, WordNormalizer, WordContextFinder, DocumentTextExtractor
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from benchmark import compare_results, generate_corpus
+from service import InterestingWordsService
+from interesting_words import (
+    WordCounter, ExactCounter, SpaceSavingCounter, CountMinSketchCounter, WordNormalizer, WordContextFinder,
+    DocumentTextExtractor, TokenizedSentence, SentenceIndex, DocumentAnalysis, AnalysisCache, analyse_document,
+    TokenFilter, TAGS, CachedTaggingBackend, LexiconTaggingBackend, PipelineMetrics, JsonLinesMetricsSink,
+    PrometheusMetricsSink, ContextExporter, CorpusAnalysis, TagWindowCounts, ContextMatcher, DocumentScanner,
+    ScannedDocument, SentenceDeduplicator, download_nltk_data
+)
 
 
 class TestWordNormalisation(TestCase):
@@ -32,6 +58,18 @@ class TestWordNormalisation(TestCase):
             ["Just", "one", "line", "text", "matter"]
         )
 
+    def test_remove_with_token_filter(self):
+        tokens = ["Just", "one", "line", "-", "Of", "text", "Doesn't", "matter", "."]
+        token_filter = TokenFilter(['of', "Doesn't"] + list(punctuation))
+        self.assertEqual(token_filter.remove(tokens), ["Just", "one", "line", "text", "matter"])
+        self.assertEqual(
+            WordNormalizer.remove_from_tokens(tokens, token_filter), ["Just", "one", "line", "text", "matter"]
+        )
+
+    def test_remove_lower_case_tokens_with_token_filter(self):
+        tokens = ["just", "one", "line", "-", "of", "text"]
+        self.assertEqual(TokenFilter(['of', '-']).remove(tokens, lower_case=True), ["just", "one", "line", "text"])
+
     def test_tag_word_types(self):
         tokens = ['car']
         self.assertEqual(
@@ -56,6 +94,56 @@ class TestWordNormalisation(TestCase):
         )
 
 
+class CountingTaggingBackend:
+
+    def __init__(self):
+        self.tagged_sentences = []
+
+    def tag_sentences(self, sentences):
+        self.tagged_sentences += sentences
+        return [[(word, 'NOUN') for word in sentence] for sentence in sentences]
+
+
+class TestTaggingBackends(TestCase):
+
+    def test_cached_backend_tags_repeated_sentence_once(self):
+        counting_backend = CountingTaggingBackend()
+        backend = CachedTaggingBackend(counting_backend)
+        sentences = [['let', 'us', 'go'], ['you', 'and', 'i'], ['let', 'us', 'go']]
+        self.assertEqual(backend.tag_sentences(sentences)[2], [('let', 'NOUN'), ('us', 'NOUN'), ('go', 'NOUN')])
+        backend.tag_sentences([['you', 'and', 'i']])
+        self.assertEqual(counting_backend.tagged_sentences, [['let', 'us', 'go'], ['you', 'and', 'i']])
+
+    def test_cached_backend_evicts_least_recently_used(self):
+        counting_backend = CountingTaggingBackend()
+        backend = CachedTaggingBackend(counting_backend, max_size=2)
+        backend.tag_sentences([['one'], ['two']])
+        backend.tag_sentences([['one'], ['three']])
+        backend.tag_sentences([['one'], ['two']])
+        self.assertEqual(counting_backend.tagged_sentences, [['one'], ['two'], ['three'], ['two']])
+
+    def test_cached_backend_store(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store_path = os.path.join(directory, 'tags.sqlite')
+        CachedTaggingBackend(CountingTaggingBackend(), store_path=store_path).tag_sentences([['let', 'us', 'go']])
+        counting_backend = CountingTaggingBackend()
+        tagged = CachedTaggingBackend(counting_backend, store_path=store_path).tag_sentences([['let', 'us', 'go']])
+        self.assertEqual(tagged, [[('let', 'NOUN'), ('us', 'NOUN'), ('go', 'NOUN')]])
+        self.assertEqual(counting_backend.tagged_sentences, [])
+
+    def test_lexicon_backend_tags_ambiguous_sentences_in_context(self):
+        counting_backend = CountingTaggingBackend()
+        backend = LexiconTaggingBackend(counting_backend, lexicon={'the': 'DET', 'car': 'NOUN'})
+        tagged = backend.tag_sentences([['the', 'car'], ['the', 'bank']])
+        self.assertEqual(tagged, [[('the', 'DET'), ('car', 'NOUN')], [('the', 'NOUN'), ('bank', 'NOUN')]])
+        self.assertEqual(counting_backend.tagged_sentences, [['the', 'bank']])
+
+    def test_tag_sentences_with_backend(self):
+        tagged_words = WordNormalizer(CountingTaggingBackend()).tag_sentences([['let', 'us', 'go', '.'], ['now', '!']])
+        self.assertEqual(tagged_words, [('let', 'NOUN'), ('us', 'NOUN'), ('go', 'NOUN'), ('now', 'NOUN')])
+
+
 class TestWordCounter(TestCase):
 
     def test_most_common_word(self):
@@ -82,6 +170,12 @@ class TestWordCounter(TestCase):
             ['matter', 'words']
         )
 
+    def test_most_common_word_ids(self):
+        counts = np.array([2, 5, 5, 3, 3])
+        self.assertEqual(WordCounter.most_common_word_ids(counts, np.array([2, 3, 4, 0]), 2).tolist(), [2, 3])
+        self.assertEqual(WordCounter.most_common_word_ids(counts, np.array([4, 3, 0, 1]), 5).tolist(), [1, 3, 4, 0])
+        self.assertEqual(WordCounter.most_common_word_ids(counts, np.array([4, 3]), 0).tolist(), [])
+
     def test_filter_out_most_common(self):
         tokens = [
             "Just", "one", "line", "text", "matter", 'matter', 'words', 'words', 'matter',
@@ -94,6 +188,50 @@ class TestWordCounter(TestCase):
         )
 
 
+class TestStreamingCounters(TestCase):
+
+    def setUp(self):
+        self.shards = [
+            ['go'] * 50 + ['us'] * 30 + [f'rare{i}' for i in range(40)],
+            ['let'] * 45 + ['us'] * 20 + [f'other{i}' for i in range(40)],
+        ]
+
+    def merged(self, new_counter):
+        counters = [new_counter() for _ in self.shards]
+        for counter, shard in zip(counters, self.shards):
+            counter.update(shard)
+        return counters[0].merge(counters[1])
+
+    def test_exact_counter_merge(self):
+        counter = self.merged(ExactCounter)
+        self.assertEqual(counter.most_common(3), [('go', 50), ('us', 50), ('let', 45)])
+        self.assertEqual(len(counter), 83)
+
+    def test_most_common_words_with_counter(self):
+        counter = ExactCounter()
+        counter.update(self.shards[0])
+        self.assertEqual(WordCounter.most_common_words(self.shards[1], ['us', 'go', 'let'], 2, counter), ['go', 'us'])
+
+    def test_space_saving_counter_within_error_bound(self):
+        counter = self.merged(lambda: SpaceSavingCounter(capacity=10))
+        self.assertEqual(len(counter), 10)
+        self.assertEqual(counter.total, 225)
+        self.assertEqual([word for word, count in counter.most_common(3)], ['go', 'us', 'let'])
+        for word, true_count in [('us', 50), ('go', 50), ('let', 45), ('rare0', 1)]:
+            self.assertGreaterEqual(counter[word], true_count)
+            self.assertLessEqual(counter[word] - counter.error(word), true_count)
+            self.assertLessEqual(counter.error(word), counter.total / counter.capacity)
+
+    def test_count_min_sketch_within_error_bound(self):
+        counter = self.merged(lambda: CountMinSketchCounter(epsilon=0.01, candidates=5))
+        self.assertEqual([word for word, count in counter.most_common(3)], ['go', 'us', 'let'])
+        for word, true_count in [('us', 50), ('go', 50), ('let', 45), ('rare0', 1)]:
+            self.assertGreaterEqual(counter[word], true_count)
+            self.assertLessEqual(counter[word], true_count + 0.01 * counter.total)
+        with self.assertRaises(ValueError):
+            counter.merge(CountMinSketchCounter(epsilon=0.1))
+
+
 class TestWordContextFinder(TestCase):
 
     def test_get_context_of_word(self):
@@ -227,6 +365,474 @@ class TestWordContextFinder(TestCase):
             }
         )
 
+    def test_get_context_of_tokenized_sentences(self):
+        sentences = [
+            TokenizedSentence('text_1', 0, 'let us go then', ['let', 'us', 'go', 'then']),
+            TokenizedSentence('text_2', 0, 'Let us go.', ['let', 'us', 'go', '.']),
+            TokenizedSentence('text_2', 1, 'you and i', ['you', 'and', 'i']),
+        ]
+        contexts = WordContextFinder.get_tokenized_word_contexts(sentences, ['Us'])
+        self.assertEqual(dict(contexts), {'us': ['text_1: let us go then', 'text_2: Let us go.']})
+
+    def test_get_context_of_tokenized_sentences_deduplicated(self):
+        sentences = [
+            TokenizedSentence('text_1', 0, 'let us go', ['let', 'us', 'go']),
+            TokenizedSentence('text_2', 0, 'let us go', ['let', 'us', 'go']),
+            TokenizedSentence('text_2', 1, 'let us go', ['let', 'us', 'go']),
+            TokenizedSentence('text_2', 2, 'Let us go.', ['let', 'us', 'go', '.']),
+        ]
+        contexts = WordContextFinder.get_tokenized_word_contexts(sentences, ['us'], SentenceDeduplicator())
+        self.assertEqual(dict(contexts), {'us': ['text_1, text_2: let us go', 'text_2: Let us go.']})
+
+
+class TestContextMatcher(TestCase):
+
+    sentences = [
+        ('text_1', 'thus we go, #us and us2'), ('text_1', 'let us go'), ('text_1', 'Tell US <3'),
+        ('text_2', 'so coooooool!!!'), ('text_2', 'fish &amp; chips'), ('text_2', 'let us go'),
+    ]
+
+    def test_candidates(self):
+        matcher = ContextMatcher(['us'], TweetTokenizer())
+        self.assertEqual(matcher.candidates([s for _, s in self.sentences]).tolist(), [0, 1, 2, 4, 5])
+
+    def test_tokens_not_substrings(self):
+        contexts = ContextMatcher(['us', '#us', '<3'], TweetTokenizer()).word_contexts(self.sentences)
+        self.assertEqual(
+            dict(contexts),
+            {
+                '#us': ['text_1: thus we go, #us and us2'],
+                'us': ['text_1: let us go', 'text_1: Tell US <3', 'text_2: let us go'],
+                '<3': ['text_1: Tell US <3'],
+            }
+        )
+
+    def test_shortened_runs_and_html_entities(self):
+        contexts = ContextMatcher(['coooooool', 'coool', '&'], TweetTokenizer()).word_contexts(self.sentences)
+        self.assertEqual(
+            dict(contexts), {'coooooool': ['text_2: so coooooool!!!'], '&': ['text_2: fish &amp; chips']}
+        )
+
+    def test_batches_and_threads_same_contexts(self):
+        sentences = self.sentences * 50
+        words = ['us', 'go', 'chips', 'missing']
+        tokenizer = TweetTokenizer()
+        expected = WordContextFinder.get_tokenized_word_contexts(
+            (
+                TokenizedSentence(document, i, sentence, [w.lower() for w in tokenizer.tokenize(sentence)])
+                for i, (document, sentence) in enumerate(sentences)
+            ),
+            words
+        )
+        matcher = ContextMatcher(words, tokenizer)
+        self.assertEqual(matcher.word_contexts(sentences, batch_size=7), expected)
+        self.assertEqual(matcher.word_contexts(sentences, batch_size=7, workers=4), expected)
+
+    def test_no_words(self):
+        self.assertEqual(dict(ContextMatcher([], TweetTokenizer()).word_contexts(self.sentences)), {})
+
+
+class TestSentenceIndex(TestCase):
+
+    def setUp(self):
+        self.index = SentenceIndex()
+        for sentence in [
+            TokenizedSentence('text_1', 0, 'let us go, us two', ['let', 'us', 'go', ',', 'us', 'two']),
+            TokenizedSentence('text_1', 1, 'you and i', ['you', 'and', 'i']),
+            TokenizedSentence('text_2', 0, 'Let us go.', ['let', 'us', 'go', '.']),
+        ]:
+            self.index.add(sentence)
+
+    def test_postings_once_per_sentence(self):
+        self.assertEqual(self.index.postings('us'), [('text_1', 0), ('text_2', 0)])
+
+    def test_postings_different_case(self):
+        self.assertEqual(self.index.postings('You'), [('text_1', 1)])
+
+    def test_postings_missing_word(self):
+        self.assertEqual(self.index.postings('evening'), [])
+
+    def test_get_word_contexts(self):
+        self.assertEqual(
+            dict(self.index.get_word_contexts(['us', 'I', 'evening'])),
+            {'us': ['text_1: let us go, us two', 'text_2: Let us go.'], 'i': ['text_1: you and i']}
+        )
+
+    def test_iter_word_contexts(self):
+        word_contexts = self.index.iter_word_contexts(['us', 'I', 'evening', 'US'], max_contexts=1)
+        self.assertEqual(
+            [(word, list(contexts)) for word, contexts in word_contexts],
+            [('us', ['text_1: let us go, us two']), ('i', ['text_1: you and i'])]
+        )
+
+    def test_reads_sentences_from_byte_offsets(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        document_path = os.path.join(directory, 'text_3.txt')
+        with open(document_path, 'wb') as file:
+            file.write('Ça va?\r\nLet us\r\ngo.'.encode())
+        self.index.add_document('text_3', document_path)
+        self.index.add(TokenizedSentence('text_3', 0, 'Ça va?', ['ça', 'va', '?'], 0, 7))
+        self.index.add(TokenizedSentence('text_3', 1, 'Let us\ngo.', ['let', 'us', 'go', '.'], 9, 11))
+        self.assertEqual(len(self.index._texts), 3)
+        self.assertEqual(self.index.sentence('text_3', 1), 'Let us\ngo.')
+        self.assertEqual(
+            dict(self.index.get_word_contexts(['ça', 'go'])),
+            {
+                'ça': ['text_3: Ça va?'],
+                'go': ['text_1: let us go, us two', 'text_2: Let us go.', 'text_3: Let us\ngo.'],
+            }
+        )
+        self.assertEqual(list(self.index.sentences())[-2:], [('text_3', 'Ça va?'), ('text_3', 'Let us\ngo.')])
+
+
+class TestDeduplicatedSentenceIndex(TestCase):
+
+    sentences = [
+        TokenizedSentence('text_1', 0, 'let us go', ['let', 'us', 'go']),
+        TokenizedSentence('text_1', 1, 'let us go then', ['let', 'us', 'go', 'then']),
+        TokenizedSentence('text_1', 2, 'let us go', ['let', 'us', 'go']),
+        TokenizedSentence('text_2', 0, 'you and i', ['you', 'and', 'i']),
+        TokenizedSentence('text_2', 1, 'let us go', ['let', 'us', 'go']),
+    ]
+    expected = {'us': ['text_1, text_2: let us go', 'text_1: let us go then'], 'i': ['text_2: you and i']}
+
+    def test_contexts_list_documents_of_repeated_sentences(self):
+        index = SentenceIndex(SentenceDeduplicator())
+        for sentence in self.sentences:
+            index.add(sentence)
+        self.assertEqual(dict(index.get_word_contexts(['us', 'i'])), self.expected)
+        self.assertEqual(
+            [(word, list(contexts)) for word, contexts in index.iter_word_contexts(['us'], max_contexts=1)],
+            [('us', ['text_1, text_2: let us go'])]
+        )
+        self.assertEqual(index.number_of_duplicates, 2)
+        self.assertEqual(len(index.postings('us')), 4)
+
+    def test_merge_deduplicates_across_indexes(self):
+        first_index, second_index = SentenceIndex(SentenceDeduplicator()), SentenceIndex(SentenceDeduplicator())
+        for sentence in self.sentences[:3]:
+            first_index.add(sentence)
+        for sentence in self.sentences[3:]:
+            second_index.add(sentence)
+        index = SentenceIndex()
+        index.merge(first_index)
+        index.merge(second_index)
+        self.assertEqual(dict(index.get_word_contexts(['us', 'i'])), self.expected)
+        self.assertEqual(index.number_of_duplicates, 2)
+        with self.assertRaises(ValueError):
+            index.merge(SentenceIndex())
+
+    def test_forgets_least_recent_sentences(self):
+        index = SentenceIndex(SentenceDeduplicator(max_sentences=1))
+        for sentence in self.sentences:
+            index.add(sentence)
+        self.assertEqual(
+            index.get_word_contexts(['us'])['us'],
+            ['text_1: let us go', 'text_1: let us go then', 'text_1: let us go', 'text_2: let us go']
+        )
+
+
+class TestSentenceDeduplicator(TestCase):
+
+    def test_exact_duplicates(self):
+        deduplicator = SentenceDeduplicator()
+        keys = [
+            deduplicator.key(TokenizedSentence('text_1', 0, sentence, sentence.lower().split()))
+            for sentence in ['Let us go.', 'Let us go.', 'let us go.']
+        ]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+
+    def test_near_duplicates(self):
+        deduplicator = SentenceDeduplicator(near_duplicates=True)
+        keys = [
+            deduplicator.key(TokenizedSentence('text_1', i, sentence, sentence.split()))
+            for i, sentence in enumerate([
+                'the quick brown fox jumps over the lazy dog today',
+                'the quick brown fox jumps over the lazy cat today',
+                'let us go then you and i',
+            ])
+        ]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+        first_sentence = TokenizedSentence('text_1', 0, 'the quick brown fox jumps over the lazy dog today', [])
+        self.assertEqual(keys[1], SentenceDeduplicator().key(first_sentence))
+
+    def test_near_duplicates_memory_is_bounded(self):
+        deduplicator = SentenceDeduplicator(max_sentences=1, near_duplicates=True)
+        first, second = 'the quick brown fox jumps over the lazy dog', 'let us go then you and i'
+        first_key = deduplicator.key(TokenizedSentence('text_1', 0, first, first.split()))
+        deduplicator.key(TokenizedSentence('text_1', 1, second, second.split()))
+        self.assertLessEqual(len(deduplicator._seen_bands), 16)
+        self.assertNotEqual(deduplicator.key(TokenizedSentence('text_1', 2, f'{first}!', first.split())), first_key)
+        self.assertEqual(len(pickle.loads(pickle.dumps(deduplicator))._seen_bands), 0)
+
+
+class TestDocumentAnalysis(TestCase):
+
+    def test_follower_masks(self):
+        analysis = DocumentAnalysis()
+        analysis.count_tokens(['just', 'three', 'words', 'just', 'say'])
+        analysis.add_tagged_words(
+            [('just', 'ADV'), ('three', 'NUM'), ('words', 'NOUN'), ('just', 'ADV'), ('say', 'VERB')]
+        )
+        self.assertEqual(analysis.following_types, {'just': {'NUM', 'VERB'}, 'three': {'NOUN'}, 'words': {'ADV'}})
+        self.assertEqual(
+            analysis.follower_masks.tolist(),
+            [(1 << TAGS.index('NUM')) | (1 << TAGS.index('VERB')), 1 << TAGS.index('NOUN'), 1 << TAGS.index('ADV'), 0]
+        )
+
+    def test_merge(self):
+        analysis_1, analysis_2 = DocumentAnalysis(), DocumentAnalysis()
+        analysis_1.count_tokens(['let', 'us', 'go'])
+        analysis_1.add_tagged_words([('let', 'VERB'), ('us', 'PRON'), ('go', 'VERB')])
+        analysis_1.sentence_index.add(TokenizedSentence('text_1', 0, 'let us go', ['let', 'us', 'go']))
+        analysis_2.count_tokens(['us', 'too'])
+        analysis_2.add_tagged_words([('us', 'PRON'), ('too', 'ADV')])
+        analysis_2.sentence_index.add(TokenizedSentence('text_2', 0, 'us too', ['us', 'too']))
+
+        merged = analysis_1.merge(analysis_2)
+        self.assertEqual(merged.token_counts, {'let': 1, 'us': 2, 'go': 1, 'too': 1})
+        self.assertEqual(merged.following_types, {'let': {'PRON'}, 'us': {'VERB', 'ADV'}})
+        self.assertEqual(merged.vocabulary.decode(merged.token_ids), ['let', 'us', 'go', 'us', 'too'])
+        self.assertEqual(merged.sentence_index.postings('us'), [('text_1', 0), ('text_2', 0)])
+
+
+class TestTagWindowCounts(TestCase):
+
+    def test_counts_within_sentences(self):
+        tag_windows = TagWindowCounts(window=2)
+        tag_windows.grow(3)
+        tags = np.array([TAGS.index(tag) for tag in ['VERB', 'PRON', 'VERB', 'PRON', 'VERB']])
+        tag_windows.add(np.array([0, 1, 2, 1, 2]), tags, [3, 2])
+        self.assertEqual(tag_windows.distribution(1)[0, TAGS.index('PRON')], 1)
+        self.assertEqual(tag_windows.distribution(1)[2].sum(), 0)
+        self.assertEqual(tag_windows.distribution(1, following=False)[2, TAGS.index('PRON')], 2)
+        self.assertEqual(tag_windows.distribution(2)[0, TAGS.index('VERB')], 1)
+        self.assertEqual(tag_windows.distribution(2)[1].sum(), 0)
+        self.assertEqual(tag_windows.cardinality(1).tolist(), [1, 1, 0])
+        self.assertEqual(tag_windows.entropy(1).tolist(), [0.0, 0.0, 0.0])
+
+    def test_entropy(self):
+        tag_windows = TagWindowCounts()
+        tag_windows.grow(2)
+        tags = np.array([TAGS.index(tag) for tag in ['VERB', 'NOUN', 'VERB', 'ADV']])
+        tag_windows.add(np.array([0, 1, 0, 1]), tags, [2, 2])
+        self.assertEqual(tag_windows.entropy(1).tolist(), [1.0, 0.0])
+        self.assertEqual(tag_windows.cardinality(1).tolist(), [2, 0])
+
+    def test_analysis_counts_sentences_and_merges(self):
+        analysis_1, analysis_2 = DocumentAnalysis(tag_window=1), DocumentAnalysis(tag_window=1)
+        analysis_1.count_tokens(['let', 'us', 'go'])
+        analysis_1.add_tagged_words([('then', 'ADV'), ('let', 'VERB'), ('us', 'PRON'), ('go', 'VERB')], [1, 2])
+        analysis_2.count_tokens(['us', 'too'])
+        analysis_2.add_tagged_words([('us', 'PRON'), ('too', 'ADV')], [2])
+        merged = analysis_1.merge(analysis_2)
+        us = merged.vocabulary.lookup(['us'])[0]
+        self.assertEqual(merged.following_types['then'], {'VERB'})
+        self.assertEqual(merged.tag_windows.cardinality(1)[merged.vocabulary.lookup(['then'])[0]], 0)
+        following_us = merged.tag_windows.distribution(1)[us]
+        self.assertEqual((following_us[TAGS.index('ADV')], following_us[TAGS.index('VERB')]), (1, 1))
+
+        with mock.patch.object(TokenFilter, 'stopword_filter', return_value=TokenFilter(['let'])):
+            corpus_analysis = CorpusAnalysis(merged)
+        self.assertEqual(corpus_analysis.most_ambiguous_words(5), [('us', 1.0, 2)])
+        self.assertEqual(corpus_analysis.most_ambiguous_words(5, following=False), [('go', 0.0, 1), ('too', 0.0, 1)])
+
+
+class TestCorpusAnalysis(TestCase):
+
+    def setUp(self):
+        analysis = DocumentAnalysis()
+        analysis.count_tokens(['let', 'us', 'go', 'and', 'go', 'then', 'us'])
+        analysis.add_tagged_words(
+            [('let', 'VERB'), ('us', 'PRON'), ('go', 'VERB'), ('and', 'CONJ'), ('go', 'VERB'), ('then', 'ADV'),
+             ('us', 'PRON'), ('go', 'NOUN'), ('and', 'DET'), ('let', 'NOUN')]
+        )
+        with mock.patch.object(TokenFilter, 'stopword_filter', return_value=TokenFilter(['and'])):
+            self.corpus_analysis = CorpusAnalysis(analysis)
+
+    def test_interesting_words_for_any_threshold(self):
+        self.assertEqual(self.corpus_analysis.interesting_word_ids(2).tolist(), [1, 2, 3])
+        self.assertEqual(self.corpus_analysis.interesting_words(2), ['us', 'go'])
+        self.assertEqual(self.corpus_analysis.interesting_words(1), ['let', 'us', 'go', 'then'])
+        self.assertEqual(self.corpus_analysis.interesting_words(3), ['go'])
+        self.assertEqual(self.corpus_analysis.interesting_words(4), [])
+
+    def test_words_without_following_types_are_never_interesting(self):
+        analysis = DocumentAnalysis()
+        analysis.count_tokens(['go', ',', 'go', '.'])
+        analysis.add_tagged_words([('go', 'VERB'), ('go', 'VERB')])
+        with mock.patch.object(TokenFilter, 'stopword_filter', return_value=TokenFilter([])):
+            corpus_analysis = CorpusAnalysis(analysis)
+        self.assertEqual(corpus_analysis.interesting_words(0), ['go'])
+        self.assertEqual(corpus_analysis.most_common_words(0, 5), ['go'])
+        self.assertEqual(DocumentTextExtractor._find_number_follow_type_ids(analysis.follower_masks, 0).tolist(), [0])
+
+    def test_most_common_words(self):
+        self.assertEqual(self.corpus_analysis.most_common_words(1, 2), ['go', 'us'])
+        self.assertEqual(self.corpus_analysis.most_common_words(1, 1), ['go'])
+
+    def test_ties_do_not_depend_on_merge_order(self):
+        partials = []
+        for words in [['fig', 'is', 'ripe'], ['berry', 'is', 'ripe']]:
+            partial = DocumentAnalysis()
+            partial.count_tokens(words)
+            partial.add_tagged_words(list(zip(words, ['NOUN', 'VERB', 'ADJ'])))
+            partials.append(partial)
+        most_common = []
+        for first, second in [partials, partials[::-1]]:
+            with mock.patch.object(TokenFilter, 'stopword_filter', return_value=TokenFilter(['is', 'ripe'])):
+                corpus_analysis = CorpusAnalysis(DocumentAnalysis().merge(first).merge(second))
+            most_common.append(corpus_analysis.most_common_words(0, 1))
+        self.assertEqual(most_common, [['berry'], ['berry']])
+
+    def test_read_only(self):
+        with self.assertRaises(ValueError):
+            self.corpus_analysis.counts[0] = 10
+
+
+class TestAnalysisCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.document_path = os.path.join(self.directory, 'doc.txt')
+        self.cache_path = os.path.join(self.directory, 'cache.pickle')
+        with open(self.document_path, 'w') as file:
+            file.write('let us go then')
+        self.analysis = DocumentAnalysis()
+        self.analysis.count_tokens(['let', 'us', 'go', 'then'])
+
+    def test_reloads_saved_analysis(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis)
+        cache.save()
+        cached_analysis = AnalysisCache(self.cache_path).get(self.document_path, None)
+        self.assertEqual(cached_analysis.token_counts, self.analysis.token_counts)
+
+    def test_miss_on_changed_document(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis)
+        with open(self.document_path, 'w') as file:
+            file.write('you and i')
+        self.assertIsNone(cache.get(self.document_path, None))
+
+    def test_hit_on_touched_unchanged_document(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis)
+        stat = os.stat(self.document_path)
+        os.utime(self.document_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIs(cache.get(self.document_path, None), self.analysis)
+
+    def test_touched_unchanged_document_is_not_reported_changed(self):
+        self.analysis.sentence_index.add_document('doc', self.document_path)
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis)
+        cache.save()
+        stat = os.stat(self.document_path)
+        os.utime(self.document_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        for _ in range(2):
+            cache = AnalysisCache(self.cache_path)
+            cached_analysis = cache.get(self.document_path, None)
+            cache.save()
+            self.assertEqual(cached_analysis.sentence_index.changed_documents(), [])
+
+    def test_miss_on_different_chunk_size(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis)
+        self.assertIsNone(cache.get(self.document_path, 1024))
+
+    def test_miss_on_different_tag_window(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis)
+        self.assertIsNone(cache.get(self.document_path, None, tag_window=2))
+
+    def test_miss_on_different_deduplicator(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis, deduplicator=SentenceDeduplicator())
+        self.assertIsNotNone(cache.get(self.document_path, None, deduplicator=SentenceDeduplicator()))
+        self.assertIsNone(cache.get(self.document_path, None))
+        self.assertIsNone(cache.get(self.document_path, None, deduplicator=SentenceDeduplicator(near_duplicates=True)))
+
+    def test_miss_on_different_tagging_backend(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis, tagging_backend=LexiconTaggingBackend())
+        self.assertIsNotNone(cache.get(self.document_path, None, tagging_backend=LexiconTaggingBackend()))
+        self.assertIsNotNone(
+            cache.get(self.document_path, None, tagging_backend=CachedTaggingBackend(LexiconTaggingBackend()))
+        )
+        self.assertIsNone(cache.get(self.document_path, None))
+        self.assertIsNone(cache.get(self.document_path, None, tagging_backend=CountingTaggingBackend()))
+        self.assertIsNone(
+            cache.get(self.document_path, None, tagging_backend=LexiconTaggingBackend(lexicon={'go': 'VERB'}))
+        )
+
+    def test_evicts_deleted_documents(self):
+        cache = AnalysisCache(self.cache_path)
+        cache.put(self.document_path, None, self.analysis)
+        os.remove(self.document_path)
+        cache.evict_deleted()
+        self.assertNotIn(self.document_path, cache)
+
+
+class TestDocumentScanner(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        os.makedirs(os.path.join(self.directory, 'notes', 'drafts'))
+        documents = {
+            'a.txt': 'Let us go then.'.encode(),
+            'notes/b.txt': 'Café au lait.'.encode(),
+            'notes/drafts/c.txt': b'you and i',
+            'notes/latin.txt': 'Café au lait.'.encode('latin-1'),
+            'notes/wide.txt': 'you and i'.encode('utf-16'),
+            'image.png': b'\x89PNG\r\n\x1a\n\x00\x00',
+        }
+        for name, content in documents.items():
+            with open(os.path.join(self.directory, name), 'wb') as file:
+                file.write(content)
+
+    def test_walks_subdirectories_and_skips_other_encodings(self):
+        scanner = DocumentScanner()
+        documents = scanner.scan(self.directory)
+        self.assertEqual(sorted(d.name for d in documents), ['a.txt', 'notes/b.txt', 'notes/drafts/c.txt'])
+        self.assertEqual(
+            scanner.skipped, {'image.png': 'binary', 'notes/latin.txt': 'unknown', 'notes/wide.txt': 'utf-16'}
+        )
+        document = next(d for d in documents if d.name == 'notes/b.txt')
+        self.assertEqual((document.path, document.size), (f'{self.directory}/notes/b.txt', 14))
+
+    def test_does_not_follow_symlinked_directories(self):
+        os.symlink('.', os.path.join(self.directory, 'self'))
+        os.symlink('notes', os.path.join(self.directory, 'linked_notes'))
+        os.symlink('a.txt', os.path.join(self.directory, 'linked_a.txt'))
+        documents = DocumentScanner(include=['*.txt']).scan(self.directory)
+        self.assertEqual(
+            sorted(d.name for d in documents), ['a.txt', 'linked_a.txt', 'notes/b.txt', 'notes/drafts/c.txt']
+        )
+
+    def test_include_and_exclude_globs(self):
+        scanner = DocumentScanner(include=['*.txt'], exclude=['notes/drafts', '*/latin.txt'])
+        self.assertEqual(sorted(d.name for d in scanner.scan(self.directory)), ['a.txt', 'notes/b.txt'])
+        self.assertEqual(scanner.skipped, {'notes/wide.txt': 'utf-16'})
+        self.assertEqual([d.name for d in DocumentScanner(['*.txt'], recursive=False).scan(self.directory)], ['a.txt'])
+
+    def test_unchanged_documents_are_not_read(self):
+        scanner = DocumentScanner(include=['*.txt'])
+        with mock.patch.object(scanner, 'detect_encoding', wraps=scanner.detect_encoding) as detect_encoding:
+            documents = scanner.scan(self.directory, lambda path, size, mtime: path.endswith('.txt'))
+        detect_encoding.assert_not_called()
+        self.assertEqual(len(documents), 5)
+
+    def test_detects_utf8_cut_by_sample(self):
+        document_path = os.path.join(self.directory, 'notes/b.txt')
+        self.assertEqual(DocumentScanner(sample_size=4).detect_encoding(document_path), 'utf-8')
+        self.assertEqual(DocumentScanner(sample_size=4).detect_encoding(f'{self.directory}/notes/latin.txt'), 'utf-8')
+        self.assertEqual(DocumentScanner().detect_encoding(f'{self.directory}/notes/latin.txt'), 'unknown')
+
 
 class TestDocumentTextExtractor(TestCase):
 
@@ -251,6 +857,12 @@ class TestDocumentTextExtractor(TestCase):
         text_extractor._extract_sentence_and_work_tokens('tests_files/test_directory_single_file')
         self.assertEqual(text_extractor._sentence_tokens, [('single_file.txt', 'one, two, three and four')])
 
+    def test_tokenizes_sentences_once_with_document_and_offset(self):
+        text_extractor = DocumentTextExtractor('test_directory', 5, 10)
+        text_extractor._extract_sentence_and_work_tokens('tests_files/test_directory_single_file')
+        self.assertEqual(text_extractor._word_tokens, ['one', ',', 'two', ',', 'three', 'and', 'four'])
+        self.assertEqual(text_extractor._analysis.sentence_index.postings('three'), [('single_file.txt', 0)])
+
     def test_gets_num_of_sentences(self):
         text_extractor = DocumentTextExtractor('test_directory', 5, 10)
         text_extractor._extract_sentence_and_work_tokens('tests_files/test_directory_single_file')
@@ -317,6 +929,237 @@ class TestDocumentTextExtractor(TestCase):
             text_extractor.get_interesting_words(number_following=2), ['take', 'nothing', 'time', 'whenever', 'get']
         )
 
+    def test_queries_reuse_analysis(self):
+        text_extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10)
+        words = text_extractor.get_interesting_words(number_following=2)
+        token_counts = text_extractor._analysis.token_counts
+        self.assertEqual(text_extractor.get_interesting_words(number_following=2), words)
+        self.assertEqual(text_extractor.most_common_words(2, 3), sorted(text_extractor.most_common_words(2, 3)))
+        self.assertEqual(text_extractor._analysis.token_counts, token_counts)
+        self.assertEqual(text_extractor.metrics.stages['freeze analysis']['calls'], 1)
+
+    def test_parallel_matches_serial(self):
+        serial_extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10)
+        parallel_extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10, workers=2)
+        self.assertEqual(
+            parallel_extractor.get_interesting_words(number_following=2),
+            serial_extractor.get_interesting_words(number_following=2)
+        )
+        self.assertEqual(parallel_extractor._analysis.token_counts, serial_extractor._analysis.token_counts)
+        self.assertEqual(parallel_extractor._sentence_tokens, serial_extractor._sentence_tokens)
+
+    def test_pool_analyses_largest_documents_first(self):
+        submitted = []
+
+        class Executor(ThreadPoolExecutor):
+            def submit(self, function, document_path, document_name, *args):
+                submitted.append(document_name)
+                return super().submit(lambda: DocumentAnalysis())
+
+        extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10, workers=2)
+        documents = [
+            ScannedDocument(f'{name}.txt', name, size, 0) for name, size in [('small', 10), ('huge', 500), ('mid', 90)]
+        ]
+        with mock.patch('interesting_words.ProcessPoolExecutor', Executor):
+            partials = list(extractor._analyse_documents(documents))
+        self.assertEqual(submitted, ['huge', 'mid', 'small'])
+        self.assertEqual(len(partials), 3)
+
+    def test_lists_shard_documents_of_subdirectories(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shutil.copytree('tests_files/test_extractor', os.path.join(directory, 'nested'))
+        names = [
+            [d.name for d in DocumentTextExtractor(directory, 2, 10, shard=(i, 2))._list_shard_documents(directory)]
+            for i in range(2)
+        ]
+        self.assertEqual(sorted(names[0] + names[1]), ['nested/doc_1.txt', 'nested/doc_2.txt', 'nested/doc_3.txt'])
+        self.assertTrue(all(DocumentTextExtractor.shard_index(name, 2) == 1 for name in names[1]))
+
+    def test_skips_documents_not_utf8_past_the_scanned_start(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        corpus = os.path.join(directory, 'corpus')
+        shutil.copytree('tests_files/test_extractor', corpus)
+        with open(os.path.join(corpus, 'latin.txt'), 'wb') as file:
+            file.write(b'plain words here. ' * 600 + b'caf\xe9 au lait.')
+        extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10)
+        words = extractor.most_common_words()
+        for options in [{}, {'workers': 2}, {'chunk_size': 64}]:
+            with self.subTest(**options):
+                skipping_extractor = DocumentTextExtractor(corpus, 2, 10, **options)
+                self.assertEqual(skipping_extractor.most_common_words(), words)
+                self.assertEqual(skipping_extractor._analysis.token_counts, extractor._analysis.token_counts)
+                self.assertEqual(skipping_extractor.metrics.counters['documents_skipped'], 1)
+                self.assertEqual(skipping_extractor.metrics.counters['documents'], 3)
+                self.assertEqual(skipping_extractor.get_word_contexts(words), extractor.get_word_contexts(words))
+
+    def test_deduplicated_counts_every_copy(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        corpus = os.path.join(directory, 'corpus')
+        shutil.copytree('tests_files/test_extractor', corpus)
+        shutil.copy('tests_files/test_extractor/doc_1.txt', os.path.join(corpus, 'copy.txt'))
+        extractor = DocumentTextExtractor(corpus, 2, 10)
+        deduplicated_extractor = DocumentTextExtractor(corpus, 2, 10, deduplicator=SentenceDeduplicator())
+        words = deduplicated_extractor.most_common_words()
+        extractor.most_common_words()
+        self.assertEqual(deduplicated_extractor._analysis.token_counts, extractor._analysis.token_counts)
+        self.assertEqual(
+            deduplicated_extractor.get_interesting_words(number_following=2),
+            extractor.get_interesting_words(number_following=2)
+        )
+        self.assertGreaterEqual(deduplicated_extractor.metrics.counters['duplicate_sentences'], 1)
+        contexts = deduplicated_extractor.get_word_contexts(words)
+        self.assertTrue(all(len(set(rows)) == len(rows) for rows in contexts.values()))
+        documents = [row.split(': ', 1)[0].split(', ') for rows in contexts.values() for row in rows]
+        self.assertTrue(any({'copy.txt', 'doc_1.txt'} <= set(row_documents) for row_documents in documents))
+
+    def test_near_duplicates_match_serial_in_pool_and_shards(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        corpus = os.path.join(directory, 'corpus')
+        os.makedirs(corpus)
+        for name, animal in [('a.txt', 'dog'), ('b.txt', 'cat')]:
+            with open(os.path.join(corpus, name), 'w') as file:
+                file.write(f'the quick brown fox jumps over the lazy {animal} today. let us go then.')
+        extractors = [
+            DocumentTextExtractor(
+                corpus, 2, 10, workers=workers, deduplicator=SentenceDeduplicator(near_duplicates=True)
+            )
+            for workers in [1, 2]
+        ]
+        partial_paths = []
+        for shard in range(2):
+            partial_paths.append(os.path.join(directory, f'shard-{shard}.pickle'))
+            DocumentTextExtractor(
+                corpus, 0, 0, shard=(shard, 2), deduplicator=SentenceDeduplicator(near_duplicates=True)
+            ).save_partial(partial_paths[-1])
+        extractors.append(DocumentTextExtractor.from_partials(partial_paths, 2, 10))
+        contexts = []
+        for extractor in extractors:
+            extractor.most_common_words()
+            contexts.append({
+                word: sorted(row.split(': ', 1)[1] for row in rows)
+                for word, rows in extractor.get_word_contexts(['fox']).items()
+            })
+        self.assertEqual(len(contexts[0]['fox']), 1)
+        self.assertEqual(contexts[1], contexts[0])
+        self.assertEqual(contexts[2], contexts[0])
+
+    def test_deduplicated_given_backend_tags_repeated_sentences_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'repeated.txt'), 'w') as file:
+            file.write('the cat sat. the dog ran. the cat sat. the cat sat.')
+        counting_backend = CountingTaggingBackend()
+        extractor = DocumentTextExtractor(
+            directory, 2, 10, tagging_backend=counting_backend, deduplicator=SentenceDeduplicator()
+        )
+        extractor.most_common_words()
+        self.assertEqual(
+            sorted(map(tuple, counting_backend.tagged_sentences)), [('the', 'cat', 'sat'), ('the', 'dog', 'ran')]
+        )
+        self.assertIsNone(DocumentTextExtractor(directory, 2, 10, deduplicator=SentenceDeduplicator())._tagging_backend)
+
+    def test_stream_document_in_chunks(self):
+        chunks = list(DocumentTextExtractor._iter_document_chunks(
+            'tests_files/test_directory/test_text_2.txt', 'test_text_2.txt', 10, TweetTokenizer()
+        ))
+        self.assertEqual(
+            [(s.sentence_id, s.sentence) for chunk in chunks for s in chunk],
+            [(0, 'quite simply the second document.'), (1, "and that, for now, is all you're getting - YES!")]
+        )
+
+    def test_chunks_end_on_whitespace_of_multibyte_document(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        document_path = os.path.join(directory, 'text.txt')
+        with open(document_path, 'wb') as file:
+            file.write('Très bien, ça va.\r\nNaïve café au lait!  Über alles.'.encode())
+        expected = ['Très bien, ça va.', 'Naïve café au lait!', 'Über alles.']
+        with open(document_path, 'rb') as file:
+            content = file.read()
+        for chunk_size in [None, 1, 5, 13, 100]:
+            sentences = [
+                s for chunk in DocumentTextExtractor._iter_document_chunks(
+                    document_path, 'text.txt', chunk_size, TweetTokenizer()
+                ) for s in chunk
+            ]
+            self.assertEqual([s.sentence for s in sentences], expected)
+            self.assertEqual([content[s.offset:s.offset + s.length].decode() for s in sentences], expected)
+
+    def test_chunks_of_text_without_sentence_ends_are_bounded(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        document_path = os.path.join(directory, 'transcript.txt')
+        words = ['alpha', 'beta', 'gamma', 'delta'] * 500
+        with open(document_path, 'w') as file:
+            file.write(' '.join(words))
+        chunk_size, max_sentence_size = 64, 256
+        with mock.patch.object(DocumentTextExtractor, 'MAX_SENTENCE_SIZE', max_sentence_size):
+            chunks = list(DocumentTextExtractor._iter_document_chunks(
+                document_path, 'transcript.txt', chunk_size, TweetTokenizer()
+            ))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(sum(s.length for s in chunk), 2 * (chunk_size + max_sentence_size))
+        self.assertEqual([w for chunk in chunks for s in chunk for w in s.words], words)
+
+    def test_chunks_of_text_without_whitespace_are_bounded(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        document_path = os.path.join(directory, 'transcript.txt')
+        text = '漢字仮名交じり文' * 2000
+        with open(document_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        chunk_size, max_sentence_size = 64, 256
+        with mock.patch.object(DocumentTextExtractor, 'MAX_SENTENCE_SIZE', max_sentence_size):
+            chunks = list(DocumentTextExtractor._iter_sentence_spans(document_path, chunk_size))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(chunk[-1][1] - chunk[0][0], 2 * (chunk_size + max_sentence_size) + 3)
+        self.assertEqual(''.join(sentence for chunk in chunks for offset, end, sentence in chunk), text)
+
+    def test_streaming_matches_in_memory(self):
+        in_memory_extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10)
+        streaming_extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10, chunk_size=64)
+        streaming_extractor.get_interesting_words(number_following=2)
+        in_memory_extractor.get_interesting_words(number_following=2)
+        self.assertEqual(streaming_extractor._analysis.token_counts, in_memory_extractor._analysis.token_counts)
+        self.assertEqual(streaming_extractor._sentence_tokens, [])
+        words = ['whenever', 'time', 'sea']
+        self.assertEqual(
+            dict(streaming_extractor.get_word_contexts(words)), dict(in_memory_extractor.get_word_contexts(words))
+        )
+
+    def test_cached_rerun_only_analyses_new_documents(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        corpus = os.path.join(directory, 'corpus')
+        shutil.copytree('tests_files/test_extractor', corpus)
+        cache_path = os.path.join(directory, 'cache.pickle')
+        DocumentTextExtractor(corpus, 2, 10, cache_path=cache_path).get_interesting_words(number_following=2)
+
+        shutil.copy('tests_files/test_directory/test_text_1.txt', corpus)
+        with mock.patch('interesting_words.analyse_document', wraps=analyse_document) as analyse:
+            extractor = DocumentTextExtractor(corpus, 2, 10, cache_path=cache_path)
+            words = extractor.get_interesting_words(number_following=2)
+        self.assertEqual([c.args[1] for c in analyse.call_args_list], ['test_text_1.txt'])
+        uncached_extractor = DocumentTextExtractor(corpus, 2, 10)
+        self.assertEqual(words, uncached_extractor.get_interesting_words(number_following=2))
+        self.assertEqual(extractor._sentence_tokens, uncached_extractor._sentence_tokens)
+
+    def test_counts_documents_and_tokens(self):
+        extractor = DocumentTextExtractor('tests_files/test_extractor', 2, 10)
+        extractor.get_interesting_words(number_following=2)
+        counters = extractor.metrics.counters
+        self.assertEqual((counters['documents'], counters['sentences']), (3, len(extractor._sentence_tokens)))
+        self.assertEqual(counters['tokens'], len(extractor._word_tokens))
+        self.assertEqual(counters['unique_words'], len(set(extractor._word_tokens)))
+        self.assertIn('analyse documents', extractor.metrics.stages)
+        self.assertIn('tag', extractor.metrics.document_stages)
+
     def test_convert_to_csv_format(self):
         context_dict = {'us': ['text_1: let us go then', 'text_1: let us go']}
         csv_format = DocumentTextExtractor._convert_to_csv_form(context_dict)
@@ -339,5 +1182,361 @@ class TestDocumentTextExtractor(TestCase):
         )
 
 
+class TestContextExporter(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.word_contexts = {
+            'us': ['text_1: let us go then', 'text_1: "let us", go'],
+            'hotter': iter(['text_1: i get hotter.']),
+        }
+
+    def test_export_csv(self):
+        path = os.path.join(self.directory, 'contexts.csv')
+        self.assertEqual(ContextExporter(path, buffer_rows=2).export(self.word_contexts), 3)
+        with open(path) as file:
+            self.assertEqual(
+                file.read(),
+                'word,context\nus,text_1: let us go then\n,"text_1: ""let us"", go"\nhotter,text_1: i get hotter.\n'
+            )
+
+    def test_export_jsonl_to_file_object_with_context_cap(self):
+        file = io.StringIO()
+        self.assertEqual(ContextExporter(file, 'jsonl', max_contexts=1).export(self.word_contexts.items()), 2)
+        self.assertEqual(
+            [json.loads(line) for line in file.getvalue().splitlines()],
+            [
+                {'word': 'us', 'context': 'text_1: let us go then'},
+                {'word': 'hotter', 'context': 'text_1: i get hotter.'},
+            ]
+        )
+
+    @skipUnless(pq, 'pyarrow is not installed')
+    def test_export_parquet(self):
+        path = os.path.join(self.directory, 'contexts.parquet')
+        ContextExporter(path, buffer_rows=2).export(self.word_contexts)
+        self.assertEqual(pq.read_table(path).to_pydict(), {
+            'word': ['us', 'us', 'hotter'],
+            'context': ['text_1: let us go then', 'text_1: "let us", go', 'text_1: i get hotter.'],
+        })
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            ContextExporter('contexts.txt')
+
+
+class TestInterestingWordsService(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.analysis = DocumentAnalysis()
+        for sentence in [
+            TokenizedSentence('text_1', 0, 'let us go then', ['let', 'us', 'go', 'then']),
+            TokenizedSentence('text_1', 1, 'let us go and go', ['let', 'us', 'go', 'and', 'go']),
+        ]:
+            self.analysis.sentence_index.add(sentence)
+            self.analysis.count_tokens(sentence.words)
+        self.analysis.add_tagged_words(
+            [('let', 'VERB'), ('us', 'PRON'), ('go', 'VERB'), ('then', 'ADV'), ('let', 'NOUN'), ('us', 'PRON'),
+             ('go', 'NOUN'), ('and', 'CONJ'), ('go', 'VERB')]
+        )
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        self.service = InterestingWordsService(self.directory, executor=executor)
+        with mock.patch.object(TokenFilter, 'stopword_filter', return_value=TokenFilter(['and'])):
+            self.analysis = CorpusAnalysis(self.analysis)
+
+    def request(self, socket_path, request_line):
+        async def send():
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            writer.write(f'{request_line} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            response = await reader.read()
+            writer.close()
+            return response
+
+        head, body = asyncio.run(send()).split(b'\r\n\r\n', 1)
+        return int(head.split()[1]), json.loads(body)
+
+    def test_queries_over_unix_socket(self):
+        socket_path = os.path.join(self.directory, 'service.sock')
+
+        async def serve_and_query():
+            self.service._analysis = self.analysis
+            server = await asyncio.start_unix_server(self.service._handle, socket_path)
+            async with server:
+                return await asyncio.gather(
+                    asyncio.to_thread(self.request, socket_path, 'GET /interesting-words?number_following=2'),
+                    asyncio.to_thread(
+                        self.request, socket_path,
+                        'GET /interesting-words?number_following=1&most_common_number=1&contexts=1&max_contexts=1'
+                    ),
+                    asyncio.to_thread(self.request, socket_path, 'GET /interesting-words?number_following=two'),
+                    asyncio.to_thread(self.request, socket_path, 'GET /missing'),
+                )
+
+        self.assertEqual(asyncio.run(serve_and_query()), [
+            (200, {'words': ['go', 'us']}),
+            (200, {'words': ['go'], 'contexts': {'go': ['text_1: let us go then']}}),
+            (400, {'error': "invalid literal for int() with base 10: 'two'"}),
+            (404, {'error': 'no route for GET /missing'}),
+        ])
+
+    def test_refresh_replaces_analysis(self):
+        async def refresh_twice():
+            with mock.patch('service.build_analysis', return_value=self.analysis) as build_analysis:
+                first, second = self.service.refresh(), self.service.refresh()
+                self.assertIs(first, second)
+                await first
+                result = await self.service.interesting_words(2, 10)
+            return build_analysis.call_count, result, self.service.status()
+
+        calls, result, status = asyncio.run(refresh_twice())
+        self.assertEqual((calls, result), (1, {'words': ['go', 'us']}))
+        self.assertEqual((status['loaded'], status['refreshing'], status['tokens']), (True, False, 9))
+
+    def test_refresh_before_contexts_of_changed_documents(self):
+        document_path = os.path.join(self.directory, 'text_1.txt')
+        with open(document_path, 'w') as file:
+            file.write('let us go then')
+        analysis = DocumentAnalysis()
+        analysis.sentence_index.add_document('text_1', document_path)
+        words = ['let', 'us', 'go', 'then']
+        analysis.sentence_index.add(TokenizedSentence('text_1', 0, 'let us go then', words, 0, 14))
+        analysis.count_tokens(words)
+        analysis.add_tagged_words([('let', 'VERB'), ('us', 'PRON'), ('go', 'VERB'), ('then', 'ADV')])
+        with mock.patch.object(TokenFilter, 'stopword_filter', return_value=TokenFilter([])):
+            self.service._analysis = CorpusAnalysis(analysis)
+        with open(document_path, 'w') as file:
+            file.write('and now for something different')
+
+        async def query():
+            with mock.patch('service.build_analysis', return_value=self.analysis) as build_analysis:
+                result = await self.service.interesting_words(2, 1, contexts=True)
+            return build_analysis.call_count, result
+
+        self.assertEqual(asyncio.run(query()), (1, {'words': ['go'], 'contexts': {'go': [
+            'text_1: let us go then', 'text_1: let us go and go'
+        ]}}))
+
+    def test_errors_answered_with_500(self):
+        socket_path = os.path.join(self.directory, 'service.sock')
+
+        async def serve_and_query():
+            self.service._analysis = self.analysis
+            server = await asyncio.start_unix_server(self.service._handle, socket_path)
+            async with server:
+                with mock.patch.object(self.service, '_query', side_effect=FileNotFoundError('text_1.txt')):
+                    return await asyncio.to_thread(self.request, socket_path, 'GET /interesting-words?contexts=1')
+
+        self.assertEqual(asyncio.run(serve_and_query()), (500, {'error': 'FileNotFoundError: text_1.txt'}))
+
+
+class TestShards(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_partial(self, name, shard, words, tagged_words, tag_window=0):
+        analysis = DocumentAnalysis(tag_window)
+        analysis.count_tokens(words)
+        analysis.add_tagged_words(tagged_words, [len(tagged_words)])
+        analysis.sentence_index.add(TokenizedSentence(name, 0, ' '.join(words), words))
+        partial_path = os.path.join(self.directory, f'{name}.pickle')
+        with open(partial_path, 'wb') as file:
+            pickle.dump({
+                'version': DocumentTextExtractor.PARTIAL_VERSION, 'directory': 'documents', 'chunk_size': None,
+                'tag_window': tag_window, 'scanner': DocumentScanner().settings, 'deduplicator': None, 'shard': shard,
+                'analysis': analysis,
+            }, file)
+        return partial_path
+
+    def test_shard_index_splits_documents(self):
+        file_names = [f'doc{i}.txt' for i in range(100)]
+        shards = [DocumentTextExtractor.shard_index(file_name, 4) for file_name in file_names]
+        self.assertEqual(set(shards), {0, 1, 2, 3})
+        self.assertEqual(shards, [DocumentTextExtractor.shard_index(file_name, 4) for file_name in file_names])
+
+    def test_merge_partials(self):
+        partial_paths = [
+            self.write_partial('text_2', (1, 2), ['us', 'too'], [('us', 'PRON'), ('too', 'ADV')]),
+            self.write_partial(
+                'text_1', (0, 2), ['let', 'us', 'go'], [('let', 'VERB'), ('us', 'PRON'), ('go', 'VERB')]
+            ),
+        ]
+        with mock.patch.object(TokenFilter, 'stopword_filter', return_value=TokenFilter([])):
+            extractor = DocumentTextExtractor.from_partials(partial_paths, 2, 10)
+        self.assertEqual(extractor._analysis.token_counts, {'let': 1, 'us': 2, 'go': 1, 'too': 1})
+        self.assertEqual(extractor.most_common_words(), ['us'])
+        self.assertEqual(
+            [(word, list(contexts)) for word, contexts in extractor.analysis.word_contexts(['us'])],
+            [('us', ['text_1: let us go', 'text_2: us too'])]
+        )
+
+    def test_merge_repeated_shard(self):
+        partial_path = self.write_partial('text_1', (0, 2), ['us'], [('us', 'PRON')])
+        with self.assertRaises(ValueError):
+            DocumentTextExtractor.from_partials([partial_path, partial_path], 2, 10)
+
+    def test_merge_partials_of_different_tag_windows(self):
+        partial_paths = [
+            self.write_partial('text_1', (0, 2), ['us', 'go'], [('us', 'PRON'), ('go', 'VERB')], tag_window=2),
+            self.write_partial('text_2', (1, 2), ['us', 'too'], [('us', 'PRON'), ('too', 'ADV')]),
+        ]
+        with self.assertRaises(ValueError):
+            DocumentTextExtractor.from_partials(partial_paths, 2, 10)
+        with self.assertRaises(ValueError):
+            DocumentAnalysis(tag_window=2).merge(DocumentAnalysis(tag_window=1))
+
+    def test_merged_streamed_partials_keep_the_scanned_documents(self):
+        corpus = os.path.join(self.directory, 'corpus')
+        shutil.copytree('tests_files/test_extractor', corpus)
+        shutil.copy('tests_files/test_extractor/doc_1.txt', os.path.join(corpus, 'notes.md'))
+        partial_paths = []
+        for shard in range(2):
+            partial_paths.append(os.path.join(self.directory, f'shard-{shard}.pickle'))
+            DocumentTextExtractor(
+                corpus, 0, 0, chunk_size=64, shard=(shard, 2), scanner=DocumentScanner(include=['*.txt'])
+            ).save_partial(partial_paths[-1])
+        extractor = DocumentTextExtractor.from_partials(partial_paths, 2, 10)
+        contexts = extractor.get_word_contexts(extractor.most_common_words())
+        rows = [row for word_contexts in contexts.values() for row in word_contexts]
+        self.assertTrue(rows)
+        self.assertFalse(any(row.startswith('notes.md') for row in rows))
+
+    def test_merged_streamed_partials_keep_the_deduplicator(self):
+        corpus = os.path.join(self.directory, 'corpus')
+        shutil.copytree('tests_files/test_extractor', corpus)
+        shutil.copy('tests_files/test_extractor/doc_1.txt', os.path.join(corpus, 'copy.txt'))
+        partial_paths = []
+        for shard in range(2):
+            partial_paths.append(os.path.join(self.directory, f'shard-{shard}.pickle'))
+            DocumentTextExtractor(
+                corpus, 0, 0, chunk_size=64, shard=(shard, 2), deduplicator=SentenceDeduplicator()
+            ).save_partial(partial_paths[-1])
+        extractor = DocumentTextExtractor.from_partials(partial_paths, 2, 10)
+        contexts = extractor.get_word_contexts(extractor.most_common_words())
+        self.assertTrue(contexts)
+        self.assertTrue(all(len(set(rows)) == len(rows) for rows in contexts.values()))
+        documents = [row.split(': ', 1)[0].split(', ') for rows in contexts.values() for row in rows]
+        self.assertTrue(any({'copy.txt', 'doc_1.txt'} <= set(row_documents) for row_documents in documents))
+
+    def test_local_shards_match_single_run(self):
+        output = os.path.join(self.directory, 'interesting_words.csv')
+        subprocess.run(
+            [sys.executable, 'shards.py', 'local', 'tests_files/test_extractor', '--shards', '2',
+             '--partials', os.path.join(self.directory, 'partials'), '--number-following', '2', '--output', output],
+            check=True, capture_output=True
+        )
+        single_output = os.path.join(self.directory, 'single.csv')
+        DocumentTextExtractor('tests_files/test_extractor', 2, 10).export_interesting_words_as_csv(single_output)
+        self.assertEqual(self.context_rows(output), self.context_rows(single_output))
+
+    @staticmethod
+    def context_rows(csv_path):
+        """
+        :return: sorted List of tuples of form (word, context), the word only being written on its first row.
+        """
+        with open(csv_path, newline='') as file:
+            rows = list(csv.reader(file))[1:]
+        word_rows = []
+        for word, context in rows:
+            word = word or word_rows[-1][0]
+            word_rows.append((word, context))
+        return sorted(word_rows)
+
+
+class TestPipelineMetrics(TestCase):
+
+    def test_stage_timing_profile_and_allocations(self):
+        metrics = PipelineMetrics(profile=['tag'], trace_allocations=['tag'])
+        for _ in range(2):
+            with metrics.stage('tag'):
+                [str(i) for i in range(1000)]
+        with metrics.stage('read'):
+            pass
+        self.assertEqual((metrics.stages['tag']['calls'], metrics.stages['read']['calls']), (2, 1))
+        self.assertGreater(metrics.stages['tag']['peak_traced_bytes'], 0)
+        self.assertEqual(list(metrics.profiles), ['tag'])
+        self.assertEqual(list(metrics.allocation_snapshots), ['tag'])
+
+    def test_emit_report_to_sinks(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        reports = []
+        log_path, prometheus_path = os.path.join(directory, 'metrics.jsonl'), os.path.join(directory, 'metrics.prom')
+        metrics = PipelineMetrics(
+            [reports.append, JsonLinesMetricsSink(log_path), PrometheusMetricsSink(prometheus_path)]
+        )
+        metrics.counters.update(tokens=100)
+        metrics.stages['tag'] = {'seconds': 2.0, 'calls': 1}
+        metrics.add_document_stage_seconds({'read': 0.5})
+        metrics.emit()
+        metrics.emit()
+        self.assertEqual(reports[0]['tokens_per_second'], 50.0)
+        with open(log_path) as file:
+            self.assertEqual([json.loads(line)['counters'] for line in file], [{'tokens': 100}] * 2)
+        with open(prometheus_path) as file:
+            lines = file.read().splitlines()
+        self.assertIn('interesting_words_stage_seconds{stage="tag"} 2.0', lines)
+        self.assertIn('interesting_words_document_stage_seconds{stage="read"} 0.5', lines)
+        self.assertIn('interesting_words_tokens 100', lines)
+
+
+class TestNltkResources(TestCase):
+
+    def test_import_loads_neither_nltk_nor_pandas(self):
+        modules = subprocess.run(
+            [sys.executable, '-c', 'import sys, interesting_words; print(*sys.modules)'],
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        self.assertNotIn('nltk', modules)
+        self.assertNotIn('pandas', modules)
+
+    def test_download_nothing_when_installed(self):
+        with mock.patch('nltk.data.find'), mock.patch('nltk.download') as download:
+            self.assertEqual(download_nltk_data(), [])
+        download.assert_not_called()
+
+    def test_download_only_missing(self):
+        def find(resource):
+            if resource == 'corpora/stopwords':
+                raise LookupError(resource)
+
+        with mock.patch('nltk.data.find', side_effect=find), mock.patch('nltk.download', return_value=True) as download:
+            self.assertEqual(download_nltk_data(), ['stopwords'])
+        download.assert_called_once_with('stopwords')
+
+    def test_retry_without_ssl_verification_restores_it(self):
+        create_default_https_context = ssl._create_default_https_context
+        with mock.patch('nltk.data.find', side_effect=LookupError), \
+                mock.patch('nltk.download', side_effect=[True, False, True, True, True]) as download:
+            download_nltk_data()
+        self.assertEqual([c.args[0] for c in download.call_args_list][4:], ['stopwords'])
+        self.assertIs(ssl._create_default_https_context, create_default_https_context)
+
+
+class TestBenchmark(TestCase):
+
+    def test_generate_corpus(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        number_of_documents = generate_corpus(directory, 250000, 'documents', document_size=100000)
+        sizes = [os.path.getsize(os.path.join(directory, file_name)) for file_name in sorted(os.listdir(directory))]
+        self.assertEqual(number_of_documents, 3)
+        self.assertEqual(len(sizes), 3)
+        self.assertGreaterEqual(sum(sizes), 250000)
+
+    def test_compare_results_flags_regressions(self):
+        baseline = {'stages': {'read': {'seconds': 1.0}, 'tokenize': {'seconds': 2.0}}}
+        results = {'stages': {'read': {'seconds': 1.05}, 'tokenize': {'seconds': 3.0}, 'index': {'seconds': 1.0}}}
+        self.assertEqual(
+            compare_results(baseline, results, threshold=0.1),
+            [('read', 1.0, 1.05, 1.05, False), ('tokenize', 2.0, 3.0, 1.5, True)]
+        )
+
+
 if __name__ == '__main__':
     main()